@@ -2,12 +2,30 @@ import ska_helpers
 
 __version__ = ska_helpers.get_version(__package__)
 
-from acis_thermal_check.main import \
-    ACISThermalCheck, \
-    DPABoardTempCheck
 from acis_thermal_check.utils import \
-    calc_pitch_roll, get_options, \
-    get_acis_limits, mylog
+    calc_pitch_roll, state_index, interval_mask, get_options, \
+    get_acis_limits, get_limits, mylog, register_template_dir
+from acis_thermal_check.run_context import \
+    RunContext, register_check, run_checks
+from acis_thermal_check.prepared_model import PreparedModel
+from acis_thermal_check.validation import ResidualStats, read_validation_data
+
+# These are only imported when they are first used, since they
+# pull in the heavier dependencies (e.g. kadi and xija)
+_lazy_imports = {"ACISThermalCheck": "acis_thermal_check.main",
+                 "DPABoardTempCheck": "acis_thermal_check.main"}
+
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        import importlib
+        module = importlib.import_module(_lazy_imports[name])
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_imports))
 
 
 def test(*args, **kwargs):
@@ -0,0 +1,574 @@
+"""
+Benchmarks for acis_thermal_check. The import benchmark imports the
+package and the utilities which are used without running a model
+(e.g. :func:`~acis_thermal_check.utils.get_options` and the
+:class:`~acis_thermal_check.regression_testing.RegressionTester`),
+each in a fresh Python process, and fails if any of them takes longer
+than the allowed time or pulls in one of the heavy dependencies which
+should only be imported when the code that needs them runs, e.g.::
+
+    python -m acis_thermal_check.benchmarks --max-import-time=1.0
+
+The hot path benchmarks time the parts of a model run which do not
+depend on the model itself (pitch and roll, violations, validation
+statistics, output files, plots, and the report) on synthetic
+telemetry, states, and ephemeris of several sizes, without fetching
+any data. The results can be written to a JSON file and compared to
+the results of an earlier run, which fails if any of the benchmarks
+has become slower by more than the allowed fraction, e.g.::
+
+    python -m acis_thermal_check.benchmarks --output=baseline.json
+    python -m acis_thermal_check.benchmarks --baseline=baseline.json --tolerance=0.25
+
+The timings depend on the machine, so no baseline is kept with the
+package. A baseline should be made on the machine where the checks are
+run, with the release which is being compared against, and kept with
+the other files of that machine. The results record the machine, the
+versions of Python, NumPy, and acis_thermal_check which made them, and
+a warning is printed if the baseline was made on another machine.
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+
+# Modules which should not be imported until a model is run
+heavy_modules = ["matplotlib", "matplotlib.pyplot", "Ska.Matplotlib",
+                 "Ska.engarchive", "Ska.engarchive.fetch_sci", "kadi",
+                 "kadi.events", "kadi.commands", "Ska.DBI", "Ska.Sun",
+                 "astropy.table", "xija", "jinja2", "docutils"]
+
+# The statements which are timed by the import benchmark
+import_statements = {
+    "acis_thermal_check": "import acis_thermal_check",
+    "utils": "from acis_thermal_check.utils import get_options, "
+             "get_acis_limits",
+    "regression_testing": "from acis_thermal_check.regression_testing "
+                          "import RegressionTester",
+}
+
+_import_code = """
+import sys
+import time
+import json
+t0 = time.perf_counter()
+%s
+t1 = time.perf_counter()
+print(json.dumps({"time": t1 - t0, "modules": sorted(sys.modules)}))
+"""
+
+
+def time_import(statement, repeat=5):
+    """
+    Time an import statement in a fresh Python process.
+
+    Parameters
+    ----------
+    statement : string
+        The import statement to time.
+    repeat : integer, optional
+        The number of times the import is timed, each in its own
+        process. Default: 5
+
+    Returns
+    -------
+    A dictionary with the shortest time of the import in seconds
+    ("time") and the heavy modules which were imported by it
+    ("heavy_modules").
+    """
+    times = []
+    modules = set()
+    for i in range(repeat):
+        p = subprocess.run([sys.executable, "-c", _import_code % statement],
+                           capture_output=True, text=True)
+        if p.returncode != 0:
+            raise RuntimeError("'%s' failed:\n%s" % (statement, p.stderr))
+        out = json.loads(p.stdout.strip().splitlines()[-1])
+        times.append(out["time"])
+        modules.update(out["modules"])
+    return {"time": min(times),
+            "heavy_modules": [m for m in heavy_modules if m in modules]}
+
+
+def run_import_benchmarks(repeat=5):
+    """
+    Time each of the import statements in ``import_statements``.
+
+    Parameters
+    ----------
+    repeat : integer, optional
+        The number of times each import is timed. Default: 5
+
+    Returns
+    -------
+    A dictionary of the results of :func:`time_import`, indexed by
+    the name of each import statement.
+    """
+    return {name: time_import(statement, repeat=repeat)
+            for name, statement in import_statements.items()}
+
+
+def check_import_benchmarks(results, max_time=1.0):
+    """
+    Check the results of the import benchmark for regressions.
+
+    Parameters
+    ----------
+    results : dict
+        The results from :func:`run_import_benchmarks`.
+    max_time : float, optional
+        The longest time in seconds any of the imports may take.
+        Default: 1.0
+
+    Returns
+    -------
+    A list of the regressions which were found, which is empty
+    if there are none.
+    """
+    failures = []
+    for name, result in results.items():
+        if result["heavy_modules"]:
+            failures.append("Importing %s pulls in %s." %
+                            (name, ", ".join(result["heavy_modules"])))
+        if result["time"] > max_time:
+            failures.append("Importing %s takes %g s, more than %g s." %
+                            (name, result["time"], max_time))
+    return failures
+
+
+# Number of samples of the synthetic model runs for the hot path
+# benchmarks, which is 328 s apart as in the thermal models
+benchmark_sizes = [1000, 10000, 100000]
+
+# The MSID and name of the check used by the hot path benchmarks
+benchmark_msid = "1dpamzt"
+benchmark_name = "dpa"
+
+
+def make_synthetic_inputs(nsamples, seed=0):
+    """
+    Make synthetic but realistic inputs for the hot path benchmarks:
+    telemetry, model temperatures, commanded states, and ephemeris.
+
+    Parameters
+    ----------
+    nsamples : integer
+        The number of samples, 328 s apart. There is a new commanded
+        state every 10 samples.
+    seed : integer, optional
+        The seed of the random numbers. Default: 0
+
+    Returns
+    -------
+    A dictionary with the times ("times"), the model values of each
+    MSID ("pred"), the telemetry as a NumPy structured array ("tlm"),
+    the commanded states ("states"), the ephemeris ("ephem"), and
+    the start of the load ("load_start").
+    """
+    import numpy as np
+    from cxotime import CxoTime
+    rng = np.random.RandomState(seed)
+    t0 = CxoTime("2021:001:00:00:00").secs
+    times = t0 + 328.0 * np.arange(nsamples)
+    # A temperature with a daily cycle, which exceeds the
+    # planning limit for a few hours at a time
+    phase = 2.0 * np.pi * (times - t0) / 86400.0
+    temp = 36.0 + 3.0 * np.sin(phase) + 0.3 * np.sin(7.3 * phase)
+    pitch = 90.0 + 60.0 * np.sin(phase / 3.1)
+    roll = 5.0 * np.sin(phase / 1.7)
+    tscpos = np.where(np.sin(phase / 2.3) > 0, 75624, -99616)
+    pred = {benchmark_msid: temp, "pitch": pitch, "tscpos": tscpos,
+            "roll": roll}
+
+    # The telemetry is the model plus noise, sampled at slightly
+    # different times
+    tlm = np.zeros(nsamples, dtype=[("date", "f8"), (benchmark_msid, "f8"),
+                                    ("pitch", "f8"), ("tscpos", "f8"),
+                                    ("roll", "f8")])
+    tlm["date"] = times + 32.8
+    tlm[benchmark_msid] = temp + rng.normal(scale=0.5, size=nsamples)
+    tlm["pitch"] = pitch + rng.normal(scale=0.1, size=nsamples)
+    tlm["tscpos"] = tscpos
+    tlm["roll"] = roll + rng.normal(scale=0.1, size=nsamples)
+
+    # The commanded states, with random attitudes
+    nstates = max(nsamples // 10, 2)
+    tstart = times[::10][:nstates]
+    tstop = np.append(tstart[1:], times[-1])
+    quats = rng.normal(size=(nstates, 4))
+    quats /= np.sqrt((quats ** 2).sum(axis=1))[:, np.newaxis]
+    states = np.zeros(nstates, dtype=[("datestart", "U21"), ("datestop", "U21"),
+                                      ("tstart", "f8"), ("tstop", "f8"),
+                                      ("obsid", "i4"), ("power_cmd", "U10"),
+                                      ("pitch", "f8"), ("q1", "f8"),
+                                      ("q2", "f8"), ("q3", "f8"), ("q4", "f8"),
+                                      ("simpos", "i4"), ("ccd_count", "i4"),
+                                      ("fep_count", "i4"), ("vid_board", "i4"),
+                                      ("clocking", "i4")])
+    states["tstart"] = tstart
+    states["tstop"] = tstop
+    states["datestart"] = CxoTime(tstart).date
+    states["datestop"] = CxoTime(tstop).date
+    states["obsid"] = 20000 + np.arange(nstates) // 5
+    states["power_cmd"] = "XTZ0000005"
+    states["pitch"] = pitch[::10][:nstates]
+    for i in range(4):
+        states["q%d" % (i + 1)] = quats[:, i]
+    states["simpos"] = tscpos[::10][:nstates]
+    states["ccd_count"] = rng.randint(0, 7, size=nstates)
+    states["fep_count"] = np.maximum(states["ccd_count"], 3)
+    states["vid_board"] = 1
+    states["clocking"] = 1
+    states = states.view(np.recarray)
+
+    # The ephemeris of a 63.5 hr orbit around the Earth and the
+    # Sun on a circle of 1 AU, in meters
+    orbit = 2.0 * np.pi * (times - t0) / (63.5 * 3600.0)
+    year = 2.0 * np.pi * (times - t0) / (365.25 * 86400.0)
+    ephem = {"orbitephem0_x": 1.0e8 * np.cos(orbit),
+             "orbitephem0_y": 0.8e8 * np.sin(orbit),
+             "orbitephem0_z": 0.5e8 * np.sin(orbit),
+             "solarephem0_x": 1.496e11 * np.cos(year),
+             "solarephem0_y": 1.372e11 * np.sin(year),
+             "solarephem0_z": 0.595e11 * np.sin(year)}
+
+    return {"times": times, "pred": pred, "tlm": tlm, "states": states,
+            "ephem": ephem, "load_start": times[nsamples // 4]}
+
+
+def make_benchmark_check(inputs):
+    """
+    Make the ACISThermalCheck used by the hot path benchmarks, which
+    uses a synthetic thermal model and commanded states instead of
+    running xija and kadi.
+
+    Parameters
+    ----------
+    inputs : dict
+        The inputs from :func:`make_synthetic_inputs`.
+    """
+    from types import SimpleNamespace
+    from acis_thermal_check.main import ACISThermalCheck
+
+    comps = {"sim_z": inputs["pred"]["tscpos"]}
+    for msid in [benchmark_msid, "pitch", "roll"]:
+        comps[msid] = inputs["pred"][msid]
+    model = SimpleNamespace(times=inputs["times"],
+                            comp={k: SimpleNamespace(mvals=v, dvals=v)
+                                  for k, v in comps.items()})
+    # Two intervals where the telemetry is not expected to match
+    # the model, as in some of the model specifications
+    dt = inputs["times"][-1] - inputs["times"][0]
+    model.bad_times = [(inputs["times"][0] + f * dt, inputs["times"][0] + (f + 0.01) * dt)
+                       for f in (0.3, 0.7)]
+
+    class BenchmarkCheck(ACISThermalCheck):
+        def calc_model(self, model_spec, states, tstart, tstop, state0=None):
+            return model
+
+    valid_limits = {"1DPAMZT": [(1, 2.0), (50, 1.0), (99, 2.0)],
+                    "PITCH": [(1, 3.0), (99, 3.0)],
+                    "TSCPOS": [(1, 2.5), (99, 2.5)]}
+    check = BenchmarkCheck(benchmark_msid, benchmark_name, valid_limits,
+                           [20.0])
+    check.context = SimpleNamespace(
+        get_validation_states=lambda start, stop: inputs["states"])
+    check.predict_model = model
+    return check
+
+
+def _bench_calc_pitch_roll(check, inputs, outdir):
+    from acis_thermal_check.utils import calc_pitch_roll
+    return lambda: calc_pitch_roll(inputs["times"], inputs["ephem"],
+                                   inputs["states"])
+
+
+def _bench_prediction_viols(check, inputs, outdir):
+    temp = inputs["pred"][benchmark_msid]
+    return lambda: check._make_prediction_viols(inputs["times"], temp,
+                                                inputs["load_start"],
+                                                check.plan_hi_limit,
+                                                "planning", "max")
+
+
+def _bench_histogram_mask(check, inputs, outdir):
+    return lambda: check.get_histogram_mask(inputs["tlm"], check.hist_limit)
+
+
+def _bench_validation_stats(check, inputs, outdir):
+    return lambda: check.calc_validation(inputs["tlm"], None)
+
+
+def _bench_validation_hist(check, inputs, outdir):
+    from acis_thermal_check.utils import get_pyplot, thermal_blue
+    plt = get_pyplot()
+    stats = check.calc_validation(inputs["tlm"], None)["stats"][benchmark_msid]
+
+    # The residual histograms as in make_validation_plots
+    def run():
+        fig, axes = plt.subplots(ncols=2, num=20, figsize=(12.0, 3.5))
+        for i, histscale in enumerate(('log', 'lin')):
+            stats.plot_hist(axes[i], log=(histscale == 'log'),
+                            color=thermal_blue)
+        plt.close(fig)
+    return run
+
+
+def _bench_write_states(check, inputs, outdir):
+    return lambda: check.write_states(outdir, inputs["states"])
+
+
+def _bench_write_temps(check, inputs, outdir):
+    temps = {benchmark_name: inputs["pred"][benchmark_msid]}
+    return lambda: check.write_temps(outdir, inputs["times"], temps)
+
+
+def _bench_plot_two(check, inputs, outdir):
+    from acis_thermal_check.utils import plot_two, get_pyplot
+    plt = get_pyplot()
+
+    def run():
+        plot = plot_two(fig_id=1, x=inputs["times"],
+                        y=inputs["pred"][benchmark_msid], x2=inputs["times"],
+                        y2=inputs["pred"]["pitch"], xlabel='Date',
+                        ylabel='Temperature ($^\\circ$C)',
+                        ylabel2='Pitch (deg)', ylim2=(40, 180))
+        plt.close(plot['fig'])
+    return run
+
+
+def _bench_savefig(check, inputs, outdir):
+    from acis_thermal_check.utils import plot_two
+    plot = plot_two(fig_id=1, x=inputs["times"],
+                    y=inputs["pred"][benchmark_msid], x2=inputs["times"],
+                    y2=inputs["pred"]["pitch"], xlabel='Date',
+                    ylabel='Temperature ($^\\circ$C)',
+                    ylabel2='Pitch (deg)', ylim2=(40, 180))
+    outfile = os.path.join(outdir, "%s.png" % benchmark_msid)
+    return lambda: plot['fig'].savefig(outfile)
+
+
+def _make_report_context(check, inputs):
+    # The context of the report for the synthetic inputs, as
+    # made by ACISThermalCheck.run
+    from cxotime import CxoTime
+    viols = {"hi": {"name": "Hot (%s C)" % check.plan_hi_limit,
+                    "type": "Max",
+                    "values": check._make_prediction_viols(
+                        inputs["times"], inputs["pred"][benchmark_msid],
+                        inputs["load_start"], check.plan_hi_limit,
+                        "planning", "max")}}
+    plots_validation = [stats.as_dict() for stats in
+                        check.calc_validation(inputs["tlm"], None)["stats"].values()]
+    for plot in plots_validation:
+        plot["lines"] = {"filename": "%s_valid.png" % plot["msid"].lower()}
+        plot["hist"] = {"filename": "%s_valid_hist.png" % plot["msid"].lower()}
+    plots = {key: {"filename": "%s.png" % key}
+             for key in ["default", "pow_sim", "roll"]}
+    proc = {"name": benchmark_name.upper(), "msid": benchmark_msid.upper(),
+            "errors": [], "run_user": "acisdude", "run_time": time.ctime(),
+            "datestart": CxoTime(inputs["times"][0]).date,
+            "datestop": CxoTime(inputs["times"][-1]).date,
+            "hist_limit": check.hist_limit, "op": [">="]}
+    return {"bsdir": "/data/acis/LoadReviews/2021/JAN0421/ofls",
+            "viols": viols, "plots": plots,
+            "any_viols": len(viols["hi"]["values"]),
+            "valid_viols": check.make_validation_viols(plots_validation),
+            "proc": proc, "pred_only": False,
+            "plots_validation": plots_validation}
+
+
+def _bench_render_rst(check, inputs, outdir):
+    context = _make_report_context(check, inputs)
+    return lambda: check._render_index(context)
+
+
+def _bench_render_html(check, inputs, outdir):
+    context = _make_report_context(check, inputs)
+    rst = check._render_index(context)
+    return lambda: check.rst_to_html(outdir, context["proc"], rst=rst)
+
+
+# The hot path benchmarks. Each function does any setup which is not
+# timed and returns a function which runs the code which is timed.
+hot_path_benchmarks = {
+    "calc_pitch_roll": _bench_calc_pitch_roll,
+    "prediction_viols": _bench_prediction_viols,
+    "histogram_mask": _bench_histogram_mask,
+    "validation_stats": _bench_validation_stats,
+    "validation_hist": _bench_validation_hist,
+    "write_states": _bench_write_states,
+    "write_temps": _bench_write_temps,
+    "plot_two": _bench_plot_two,
+    "savefig": _bench_savefig,
+    "render_rst": _bench_render_rst,
+    "render_html": _bench_render_html,
+}
+
+
+def run_hot_path_benchmarks(sizes=None, names=None, repeat=5):
+    """
+    Run the hot path benchmarks on synthetic inputs.
+
+    Parameters
+    ----------
+    sizes : list of integers, optional
+        The numbers of samples of the synthetic inputs. Default:
+        ``benchmark_sizes``
+    names : list of strings, optional
+        The names of the benchmarks to run. Default: all of the
+        benchmarks in ``hot_path_benchmarks``.
+    repeat : integer, optional
+        The number of times each benchmark is run. Default: 5
+
+    Returns
+    -------
+    A dictionary of the shortest time in seconds of each benchmark,
+    indexed by the name of the benchmark and the number of samples
+    (as a string, so that it can be written as JSON).
+    """
+    import tempfile
+    import shutil
+    from acis_thermal_check.utils import get_pyplot
+    if sizes is None:
+        sizes = benchmark_sizes
+    if names is None:
+        names = list(hot_path_benchmarks)
+    plt = get_pyplot()
+    results = {name: {} for name in names}
+    outdir = tempfile.mkdtemp()
+    try:
+        for nsamples in sizes:
+            inputs = make_synthetic_inputs(nsamples)
+            check = make_benchmark_check(inputs)
+            for name in names:
+                func = hot_path_benchmarks[name](check, inputs, outdir)
+                times = []
+                for i in range(repeat):
+                    t0 = time.perf_counter()
+                    func()
+                    times.append(time.perf_counter() - t0)
+                results[name][str(nsamples)] = min(times)
+                plt.close("all")
+    finally:
+        shutil.rmtree(outdir)
+    return results
+
+
+def get_environment():
+    """
+    Get a description of the machine and of the versions of the
+    packages the benchmarks are run with, which is stored with the
+    results so that a baseline can be matched to where it was made.
+    """
+    import platform
+    import numpy as np
+    import acis_thermal_check
+    return {"host": platform.node(),
+            "platform": platform.platform(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "acis_thermal_check": acis_thermal_check.__version__}
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """
+    Compare the results of the hot path benchmarks to those of an
+    earlier run.
+
+    Parameters
+    ----------
+    results : dict
+        The results from :func:`run_hot_path_benchmarks`.
+    baseline : dict
+        The results of an earlier run, in the same form. Benchmarks
+        which are only in one of them are skipped.
+    tolerance : float, optional
+        The fraction by which a benchmark may be slower than in the
+        baseline. Default: 0.25
+
+    Returns
+    -------
+    A list of the regressions which were found, which is empty
+    if there are none.
+    """
+    failures = []
+    for name, result in results.items():
+        for nsamples, t in result.items():
+            t_base = baseline.get(name, {}).get(nsamples)
+            if t_base is not None and t > t_base * (1.0 + tolerance):
+                failures.append("%s with %s samples takes %g s, %.0f%% more "
+                                "than the baseline of %g s." %
+                                (name, nsamples, t, 100.0 * (t / t_base - 1.0),
+                                 t_base))
+    return failures
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Run the acis_thermal_check benchmarks.")
+    parser.add_argument("--max-import-time", type=float, default=1.0,
+                        help="The longest time in seconds any of the imports "
+                             "may take. Default: 1.0")
+    parser.add_argument("--no-imports", action="store_true",
+                        help="Do not run the import benchmark.")
+    parser.add_argument("--no-hot-paths", action="store_true",
+                        help="Do not run the hot path benchmarks.")
+    parser.add_argument("--benchmarks", nargs="+",
+                        choices=list(hot_path_benchmarks),
+                        help="The hot path benchmarks to run. Default: all")
+    parser.add_argument("--sizes", type=int, nargs="+", default=benchmark_sizes,
+                        help="The numbers of samples of the synthetic inputs "
+                             "of the hot path benchmarks. Default: %s" %
+                             " ".join(str(n) for n in benchmark_sizes))
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="The number of times each benchmark is run. "
+                             "Default: 5")
+    parser.add_argument("--output", help="Write the results as JSON to "
+                                         "this file.")
+    parser.add_argument("--baseline", help="Compare the results of the hot "
+                                           "path benchmarks to those in this "
+                                           "JSON file from an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="The fraction by which a hot path benchmark may "
+                             "be slower than in the baseline. Default: 0.25")
+    args = parser.parse_args()
+    out = get_environment()
+    failures = []
+    if not args.no_imports:
+        results = run_import_benchmarks(repeat=args.repeat)
+        for name, result in results.items():
+            print("%-20s %8.3f s" % (name, result["time"]))
+        failures += check_import_benchmarks(results,
+                                            max_time=args.max_import_time)
+        out["imports"] = results
+    if not args.no_hot_paths:
+        results = run_hot_path_benchmarks(sizes=args.sizes,
+                                          names=args.benchmarks,
+                                          repeat=args.repeat)
+        print("%-20s" % "" + "".join("%12d" % n for n in args.sizes))
+        for name, result in results.items():
+            print("%-20s" % name + "".join("%10.4f s" % result[str(n)]
+                                           for n in args.sizes))
+        if args.baseline is not None:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+            if baseline.get("host") != out["host"]:
+                print("WARNING: the baseline was made on %s, not on %s, so "
+                      "the timings may not be comparable." %
+                      (baseline.get("host", "an unknown machine"), out["host"]))
+            failures += compare_to_baseline(results, baseline.get("hot_paths", {}),
+                                            tolerance=args.tolerance)
+        out["hot_paths"] = results
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=4)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
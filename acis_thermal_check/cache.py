@@ -0,0 +1,449 @@
+import os
+import tempfile
+import numpy as np
+from acis_thermal_check.utils import mylog
+
+# The root of the on-disk cache. If this is None, nothing is
+# cached to disk. It can be set from the environment or by
+# calling set_cache_dir (e.g. from the --cache-dir option).
+_cache_dir = os.environ.get("ACIS_THERMAL_CHECK_CACHE", None)
+
+
+def set_cache_dir(cache_dir):
+    """
+    Set the root directory of the on-disk cache used by
+    acis_thermal_check for this process.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The path to the cache directory. If None, on-disk
+        caching is turned off.
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+
+
+def get_cache_dir(*subdirs):
+    """
+    Get the path to a (sub)directory of the on-disk cache,
+    creating it if necessary. Returns None if on-disk caching
+    is turned off.
+
+    Parameters
+    ----------
+    subdirs : strings
+        Subdirectories to join to the root of the cache.
+    """
+    if _cache_dir is None:
+        return None
+    path = os.path.join(os.path.expanduser(_cache_dir), *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_npz(filename, **arrays):
+    """
+    Write arrays to a NumPy .npz file atomically, so that other
+    processes reading the cache never see a partially written
+    file.
+
+    Parameters
+    ----------
+    filename : string
+        The path to the file to be written.
+    arrays : NumPy arrays
+        The arrays to store, keyed by name.
+    """
+    fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                   suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmpfile, filename)
+    except Exception:
+        os.remove(tmpfile)
+        raise
+
+
+class TelemetryCache(object):
+    """
+    An append-only on-disk cache of 5-minute telemetry from the
+    engineering archive. For each MSID, the times and values are
+    stored as columns in a single .npz file along with the time
+    range which has been fetched so far. On each request, only
+    the time ranges which are not already in the cache (typically
+    the last day of data) are fetched from the archive. If a request
+    starts well after the end of the cached data, only the requested
+    range is fetched and it replaces the cached data, so that the
+    gap in between is never fetched.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The directory where the cached telemetry is stored.
+    overlap : float, optional
+        The amount of time in seconds before the end of the cached
+        data which is always fetched again, to pick up any data
+        which were not yet final when they were first cached.
+        Default: 3600.0
+    """
+    def __init__(self, cache_dir, overlap=3600.0):
+        self.cache_dir = cache_dir
+        self.overlap = overlap
+
+    def _cache_file(self, msid):
+        return os.path.join(self.cache_dir, "%s.npz" % msid.lower())
+
+    def _read(self, msid):
+        cache_file = self._cache_file(msid)
+        if not os.path.exists(cache_file):
+            return None
+        with np.load(cache_file) as f:
+            return f["times"], f["vals"], f["coverage"]
+
+    def _fetch_msid(self, msid, tstart, tstop):
+        import Ska.engarchive.fetch_sci as fetch
+        data = fetch.Msid(msid, tstart, tstop, stat='5min')
+        return data.times, data.vals
+
+    def fetch_msid(self, msid, tstart, tstop):
+        """
+        Get the 5-minute telemetry for a single MSID between two
+        times, fetching from the archive only what is not already
+        in the cache.
+
+        Parameters
+        ----------
+        msid : string
+            The MSID to fetch.
+        tstart : float
+            The start time in seconds from the beginning of the mission.
+        tstop : float
+            The stop time in seconds from the beginning of the mission.
+
+        Returns
+        -------
+        A 2-tuple of NumPy arrays: times and values.
+        """
+        cached = self._read(msid)
+        if cached is not None:
+            times, vals, coverage = cached
+        if cached is None or tstart > coverage[1] + self.overlap:
+            # Nothing in the cache, or the request starts after a gap
+            # following the cached data, so fetch only the requested
+            # range and start a new cached segment with it
+            mylog.debug("Fetching %s from the archive from %.2f to %.2f" %
+                        (msid, tstart, tstop))
+            times, vals = self._fetch_msid(msid, tstart, tstop)
+            coverage = np.array([tstart, tstop])
+            fetched = True
+        elif tstop < coverage[0] - self.overlap:
+            # The request ends well before the cached data. Fetch only
+            # the requested range, and keep the (newer) cached segment.
+            mylog.debug("Fetching %s from the archive from %.2f to %.2f" %
+                        (msid, tstart, tstop))
+            times, vals = self._fetch_msid(msid, tstart, tstop)
+            return times, vals
+        else:
+            fetched = False
+            if tstart < coverage[0]:
+                # Fetch only the head which is missing and splice it
+                # on before the cached data
+                mylog.debug("Fetching %s from the archive before %.2f" %
+                            (msid, coverage[0]))
+                head_times, head_vals = self._fetch_msid(msid, tstart,
+                                                         coverage[0])
+                keep = head_times < coverage[0]
+                times = np.concatenate([head_times[keep], times])
+                vals = np.concatenate([head_vals[keep], vals])
+                coverage = np.array([tstart, coverage[1]])
+                fetched = True
+            if tstop > coverage[1]:
+                # Fetch only the tail which is missing, plus some
+                # overlap, and replace the overlapping cached data
+                tail_start = max(coverage[1] - self.overlap, coverage[0])
+                mylog.debug("Fetching %s from the archive after %.2f" %
+                            (msid, tail_start))
+                tail_times, tail_vals = self._fetch_msid(msid, tail_start,
+                                                         tstop)
+                keep = times < tail_start
+                times = np.concatenate([times[keep], tail_times])
+                vals = np.concatenate([vals[keep], tail_vals])
+                fetched = True
+            if not fetched:
+                mylog.debug("Using cached %s telemetry" % msid)
+        if fetched and len(times) > 0:
+            # Only mark the range as covered up to the last available
+            # data point, since newer data may appear in the archive
+            coverage = np.array([coverage[0], times[-1]])
+            save_npz(self._cache_file(msid), times=times, vals=vals,
+                     coverage=coverage)
+        ok = (times >= tstart) & (times <= tstop)
+        return times[ok], vals[ok]
+
+    def fetch(self, msids, tstart, tstop):
+        """
+        Get the 5-minute telemetry for a list of MSIDs between
+        two times.
+
+        Parameters
+        ----------
+        msids : list of strings
+            The MSIDs to fetch.
+        tstart : float
+            The start time in seconds from the beginning of the mission.
+        tstop : float
+            The stop time in seconds from the beginning of the mission.
+
+        Returns
+        -------
+        A dictionary of 2-tuples of NumPy arrays (times and values),
+        keyed by MSID.
+        """
+        return {msid: self.fetch_msid(msid, tstart, tstop)
+                for msid in msids}
+
+
+class EphemerisStore(object):
+    """
+    A store of the orbit and solar ephemeris from the engineering
+    archive, kept in chunks of one day, each of which holds the times
+    and values of the archive samples within that day. Only the chunks
+    which have not been fetched before are fetched from the archive.
+    Complete chunks in the past are also written to disk as .npy files,
+    which are memory-mapped when they are read again, so that they
+    never have to be fetched again.
+
+    Parameters
+    ----------
+    cache_dir : string, optional
+        The directory where the chunks are stored. Default: None,
+        which keeps the chunks in memory only.
+    chunk_size : float, optional
+        The length of each chunk in seconds. Default: 86400.0
+    """
+    msids = ['orbitephem0_{}'.format(axis) for axis in "xyz"] + \
+            ['solarephem0_{}'.format(axis) for axis in "xyz"]
+
+    def __init__(self, cache_dir=None, chunk_size=86400.0):
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self._chunks = {}
+
+    def _chunk_file(self, msid, ichunk):
+        return os.path.join(self.cache_dir, msid, "%d.npy" % ichunk)
+
+    def _read_chunk(self, ichunk):
+        if ichunk in self._chunks:
+            return self._chunks[ichunk]
+        if self.cache_dir is None:
+            return None
+        chunk = {}
+        for msid in self.msids:
+            chunk_file = self._chunk_file(msid, ichunk)
+            if not os.path.exists(chunk_file):
+                return None
+            chunk[msid] = np.load(chunk_file, mmap_mode='r')
+        self._chunks[ichunk] = chunk
+        return chunk
+
+    def _write_chunk(self, ichunk, chunk):
+        for msid in self.msids:
+            chunk_file = self._chunk_file(msid, ichunk)
+            os.makedirs(os.path.dirname(chunk_file), exist_ok=True)
+            fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(chunk_file),
+                                           suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, chunk[msid])
+                os.replace(tmpfile, chunk_file)
+            except Exception:
+                os.remove(tmpfile)
+                raise
+
+    def _fetch_chunks(self, ichunk0, ichunk1):
+        # Fetch a contiguous range of chunks from the archive and
+        # split the data into the chunks
+        import Ska.engarchive.fetch_sci as fetch
+        from cxotime import CxoTime
+        mylog.debug("Fetching ephemeris chunks %d to %d from the archive" %
+                    (ichunk0, ichunk1))
+        edges = np.arange(ichunk0, ichunk1 + 2) * self.chunk_size
+        e = fetch.MSIDset(self.msids, edges[0], edges[-1])
+        # Chunks are only written to disk once the archive has data
+        # past their end and they are safely in the past, since more
+        # recent ephemeris may still change
+        last_time = min(CxoTime.now().secs - self.chunk_size,
+                        min(e[msid].times[-1] if len(e[msid].times) > 0 else 0.0
+                            for msid in self.msids))
+        idxs = {msid: np.searchsorted(e[msid].times, edges)
+                for msid in self.msids}
+        for i, ichunk in enumerate(range(ichunk0, ichunk1 + 1)):
+            chunk = {}
+            for msid in self.msids:
+                i0, i1 = idxs[msid][i], idxs[msid][i + 1]
+                chunk[msid] = np.array([e[msid].times[i0:i1],
+                                        e[msid].vals[i0:i1]])
+            self._chunks[ichunk] = chunk
+            if self.cache_dir is not None and edges[i + 1] <= last_time:
+                self._write_chunk(ichunk, chunk)
+
+    def fetch(self, tstart, tstop):
+        """
+        Get the orbit and solar ephemeris between two times,
+        fetching from the archive only the chunks which are not
+        already in the store.
+
+        Parameters
+        ----------
+        tstart : float
+            The start time in seconds from the beginning of the mission.
+        tstop : float
+            The stop time in seconds from the beginning of the mission.
+
+        Returns
+        -------
+        A dictionary of 2-tuples of NumPy arrays (times and values),
+        keyed by MSID.
+        """
+        ichunks = np.arange(int(np.floor(tstart / self.chunk_size)),
+                            int(np.floor(tstop / self.chunk_size)) + 1)
+        missing = [ichunk for ichunk in ichunks
+                   if self._read_chunk(ichunk) is None]
+        # Fetch each contiguous range of missing chunks at once
+        while len(missing) > 0:
+            n = 1
+            while n < len(missing) and missing[n] == missing[0] + n:
+                n += 1
+            self._fetch_chunks(missing[0], missing[n - 1])
+            missing = missing[n:]
+        ephem = {}
+        for msid in self.msids:
+            data = np.concatenate([self._chunks[ichunk][msid]
+                                   for ichunk in ichunks], axis=1)
+            ok = (data[0] >= tstart) & (data[0] < tstop)
+            ephem[msid] = (data[0][ok], data[1][ok])
+        return ephem
+
+
+class DiskCache(object):
+    """
+    A simple on-disk cache of pickled Python objects. Each entry is
+    stored in its own file named after a hash of its key. When the
+    total size of the cache grows beyond *max_size*, the least
+    recently used entries are removed.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The directory where the cache entries are stored.
+    max_size : integer, optional
+        The maximum total size of the cache in bytes.
+        Default: 500 MB
+    """
+    def __init__(self, cache_dir, max_size=500*1024**2):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _cache_file(self, key):
+        import hashlib
+        digest = hashlib.md5(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "%s.pkl" % digest)
+
+    def get(self, key):
+        """
+        Get an object from the cache. Returns None if
+        there is no entry for this key.
+
+        Parameters
+        ----------
+        key : hashable object
+            The key for the entry. Its repr is used to find
+            the entry, so it should be made of simple types.
+        """
+        import pickle
+        cache_file = self._cache_file(key)
+        try:
+            with open(cache_file, "rb") as f:
+                cached_key, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            # A truncated or otherwise unreadable entry, e.g. one
+            # written by another version of Python, is a miss
+            mylog.debug("Ignoring unreadable cache entry %s: %s" %
+                        (cache_file, err))
+            return None
+        if cached_key != key:
+            return None
+        # Mark this entry as recently used
+        os.utime(cache_file)
+        return value
+
+    def set(self, key, value):
+        """
+        Store an object in the cache, removing the least
+        recently used entries if the cache is too large.
+
+        Parameters
+        ----------
+        key : hashable object
+            The key for the entry. Its repr is used to find
+            the entry, so it should be made of simple types.
+        value : object
+            The object to store, which must be picklable.
+        """
+        import pickle
+        cache_file = self._cache_file(key)
+        fd, tmpfile = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpfile, cache_file)
+        except Exception:
+            os.remove(tmpfile)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl") and entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total_size = sum(entry[1] for entry in entries)
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            mylog.debug("Removing %s from the cache" % path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+def file_signature(path):
+    """
+    Get a signature of a file, or of the backstop and continuity
+    files in a directory, which changes whenever the files are
+    modified. It is made of the names, sizes, and modification
+    times of the files.
+
+    Parameters
+    ----------
+    path : string
+        The path to the file or directory.
+    """
+    import glob
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, "CR*.backstop")) +
+                       glob.glob(os.path.join(path, "*Continuity*")))
+    else:
+        files = [path]
+    sig = []
+    for fn in files:
+        st = os.stat(fn)
+        sig.append((os.path.abspath(fn), st.st_size, st.st_mtime_ns))
+    return tuple(sig)
@@ -0,0 +1,157 @@
+"""
+Run several ACISThermalCheck models for the same load in parallel,
+each in its own process, and summarize the results. This can be used
+from Python with :func:`run_checks_parallel` or from the command line,
+e.g.::
+
+    python -m acis_thermal_check.driver --backstop_file=/data/acis/LoadReviews/2021/JAN0421/ofls \\
+        --outdir=jan0421 --models dpa_check.dpa_check.DPACheck dea_check.dea_check.DEACheck
+"""
+import os
+import sys
+import json
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from acis_thermal_check.run_context import registered_checks, \
+    registered_opts, register_check, setup_check_args
+
+
+def import_check(path):
+    """
+    Import an ACISThermalCheck subclass from its full import path,
+    e.g. "dpa_check.dpa_check.DPACheck".
+
+    Parameters
+    ----------
+    path : string
+        The module path and name of the class, separated by a "."
+        (or a ":").
+    """
+    module_name, _, class_name = path.replace(":", ".").rpartition(".")
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def _run_check(check_class, model_path, args, opts):
+    # Run a single check in a worker process and return a summary
+    # of the results which can be sent back to the parent process.
+    # Any error is reported in the summary of this check, so that
+    # the other checks still run.
+    summary = {"name": check_class.__name__,
+               "outdir": None,
+               "pred_viols": 0,
+               "valid_viols": 0,
+               "errors": []}
+    try:
+        check = check_class()
+        summary["name"] = check.name
+        check_args = setup_check_args(args, check, model_path, opts=opts)
+        summary["outdir"] = check_args.outdir
+        results = check.run(check_args)
+    except Exception as e:
+        summary["status"] = "ERROR"
+        summary["errors"].append("%s: %s" % (type(e).__name__, e))
+        return summary
+    summary["pred_viols"] = results["any_viols"]
+    if results["valid_viols"] is not None:
+        summary["valid_viols"] = len(results["valid_viols"])
+    summary["errors"] = list(results["errors"])
+    if len(summary["errors"]) > 0:
+        summary["status"] = "ERROR"
+    elif summary["pred_viols"] > 0:
+        summary["status"] = "NOT OK"
+    else:
+        summary["status"] = "OK"
+    return summary
+
+
+def run_checks_parallel(args, checks=None, nprocs=None):
+    """
+    Run several thermal model checks on the same load in parallel
+    using a pool of processes. The outputs of each check are written
+    to a subdirectory of ``args.outdir`` with the name of the model,
+    and a summary of all of the checks is written to "summary.json"
+    in ``args.outdir``.
+
+    Parameters
+    ----------
+    args : ArgumentParser arguments
+        The command-line options object, which has the options
+        attached to it as attributes.
+    checks : list of (class, string) tuples, optional
+        The ACISThermalCheck subclasses to run and the paths to their
+        model packages. Default: all checks added with
+        :func:`~acis_thermal_check.run_context.register_check`.
+    nprocs : integer, optional
+        The number of processes to use. Default: the number of
+        checks or the number of CPUs, whichever is smaller.
+
+    Returns
+    -------
+    A list of dictionaries summarizing the status and violations of
+    each check.
+    """
+    if checks is None:
+        checks = registered_checks
+    if not os.path.exists(args.outdir):
+        os.mkdir(args.outdir)
+    if nprocs is None:
+        nprocs = min(len(checks), os.cpu_count())
+    with ProcessPoolExecutor(max_workers=max(nprocs, 1)) as executor:
+        futures = [executor.submit(_run_check, check_class, model_path, args,
+                                   registered_opts.get(check_class))
+                   for check_class, model_path in checks]
+        summaries = [future.result() for future in futures]
+    with open(os.path.join(args.outdir, "summary.json"), "w") as f:
+        json.dump(summaries, f, indent=4)
+    return summaries
+
+
+def _get_model_opts(check_classes, opts):
+    # Add the additional options of each model (its "opts" attribute)
+    # to the options of the driver. They are only set in the shared
+    # arguments if they are given on the command line, so that each
+    # model otherwise gets its own default.
+    from argparse import SUPPRESS
+    opts = list(opts)
+    opt_names = {opt_name for opt_name, opt in opts}
+    for check_class in check_classes:
+        for opt_name, opt in getattr(check_class, "opts", None) or []:
+            if opt_name not in opt_names:
+                opts.append((opt_name, dict(opt, default=SUPPRESS)))
+                opt_names.add(opt_name)
+    return opts
+
+
+def main():
+    from argparse import ArgumentParser
+    from acis_thermal_check.utils import get_options
+    # Import the models first, so that their own options can be
+    # added to the options of the driver
+    pre_parser = ArgumentParser(add_help=False)
+    pre_parser.add_argument("--models", nargs="+", default=[])
+    check_classes = [import_check(path)
+                     for path in pre_parser.parse_known_args()[0].models]
+    opts = [("models", {"nargs": "+", "required": True,
+                        "help": "Full import paths of the ACISThermalCheck "
+                                "subclasses to run, e.g. dpa_check.dpa_check.DPACheck"}),
+            ("nprocs", {"type": int,
+                        "help": "Number of processes to use. Default is the "
+                                "number of models or of CPUs, whichever is smaller."})]
+    opts = _get_model_opts(check_classes, opts)
+    args = get_options("acis_thermal_check", os.getcwd(), opts=opts)
+    for check_class in check_classes:
+        register_check(check_class)
+    summaries = run_checks_parallel(args, nprocs=args.nprocs)
+    print("%-10s %-8s %10s %12s" % ("Model", "Status", "Pred viols", "Valid viols"))
+    for summary in summaries:
+        print("%-10s %-8s %10d %12d" % (summary["name"].upper(), summary["status"],
+                                        summary["pred_viols"], summary["valid_viols"]))
+        for error in summary["errors"]:
+            print("    %s" % error)
+    if any(summary["status"] == "ERROR" for summary in summaries):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
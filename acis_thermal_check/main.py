@@ -1,33 +1,48 @@
-# Matplotlib setup
-# Use Agg backend for command-line (non-interactive) operation
-import matplotlib
-matplotlib.use('Agg')
-
 import os
 from pprint import pformat
 from collections import OrderedDict, defaultdict
-import re
 import time
 import getpass
 import numpy as np
-import Ska.DBI
-import Ska.Numpy
-from cxotime import CxoTime
-import matplotlib.pyplot as plt
-from Ska.Matplotlib import cxctime2plotdate, \
-    pointpair, plot_cxctime
-import Ska.engarchive.fetch_sci as fetch
 import shutil
 import acis_thermal_check
-from astropy.io import ascii
 version = acis_thermal_check.__version__
 from acis_thermal_check.utils import \
     config_logging, TASK_DATA, plot_two, \
-    mylog, plot_one, make_state_builder, \
-    calc_pitch_roll, thermal_blue, thermal_red, \
-    paint_perigee
-from kadi import events
-from astropy.table import Table
+    mylog, plot_one, \
+    thermal_blue, thermal_red, \
+    paint_perigee, find_violations, find_limit_violations, \
+    save_figures, get_pyplot, get_template, read_dh_heater_history, \
+    get_limits, interval_mask
+from acis_thermal_check.cache import set_cache_dir
+from acis_thermal_check.run_context import RunContext
+from acis_thermal_check.prepared_model import PreparedModel
+from acis_thermal_check.timing import StageTimer
+from acis_thermal_check.validation import validation_quantiles, \
+    ResidualStats, write_validation_data
+
+
+def _to_json(obj):
+    # Convert NumPy scalars and arrays to Python types when
+    # writing results to JSON
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Cannot write %s to JSON" % type(obj).__name__)
+
+
+def _is_plain_string_column(col):
+    # Whether none of the strings in a column are empty or contain
+    # whitespace or quotes, so that none of them need to be quoted
+    # when the column is written to an ASCII table. The columns of
+    # the states repeat a few values many times, so only the unique
+    # values are checked one by one.
+    vals = np.unique(np.asarray(col).astype(str))
+    if np.any(np.char.str_len(vals) == 0):
+        return False
+    return not any(c.isspace() or c == '"' for val in vals for c in val)
+
 
 op_map = {"greater": ">",
           "greater_equal": ">=",
@@ -35,6 +50,30 @@ op_map = {"greater": ">",
           "less_equal": "<="}
 
 
+# The prepared model shared by all of the ensemble members which
+# are run in a process, set up once when the process starts
+_ensemble_model = None
+
+
+def _init_ensemble_worker(prepared):
+    global _ensemble_model
+    _ensemble_model = prepared
+
+
+def _run_ensemble_members(members):
+    # Run a batch of ensemble members, each with its own initial
+    # temperature and model parameters, using the prepared inputs
+    msid = _ensemble_model.check.msid
+    state0 = dict(_ensemble_model.state0)
+    temps = []
+    for T_init, pars in members:
+        state0[msid] = T_init
+        model_spec = dict(_ensemble_model.model_spec, pars=pars)
+        model = _ensemble_model.run(state0=dict(state0), model_spec=model_spec)
+        temps.append(model.comp[msid].mvals)
+    return np.array(temps)
+
+
 class ACISThermalCheck(object):
     r"""
     ACISThermalCheck class for making thermal model predictions
@@ -89,6 +128,12 @@ class ACISThermalCheck(object):
         "less_equal" Defaults to "greater_equal" for all values
         in *hist_limit*.
     """
+    # The additional command-line options of this model, in the form
+    # passed to get_options by its script, e.g. [("fps_nopref", {...})].
+    # They are used when the model is run together with other models
+    # by run_checks or acis_thermal_check_driver.
+    opts = None
+
     def __init__(self, msid, name, validation_limits, hist_limit,
                  other_telem=None, other_map=None,
                  flag_cold_viols=False, hist_ops=None):
@@ -99,25 +144,65 @@ class ACISThermalCheck(object):
         self.hist_limit = hist_limit
         self.other_telem = other_telem
         self.other_map = other_map
-        # Initially, the state_builder is set to None, as it will get
-        # set up later
+        # Initially, the state_builder and the run context are set to
+        # None, as they will get set up later
         self.state_builder = None
+        self.context = None
         self.flag_cold_viols = flag_cold_viols
         if hist_ops is None:
             hist_ops = ["greater_equal"]*len(hist_limit)
         self.hist_ops = hist_ops
         self.perigee_passages = []
+        self.limit_viols = {}
+        # The number of processes used to save the plots
+        self.plot_nprocs = 1
+        self.data_only = False
+        # Whether the temperatures and states are also written
+        # to binary files
+        self.write_npz = False
+        # Records the time spent in each stage of the run
+        self.timer = StageTimer()
+
+    def __getstate__(self):
+        # Leave out the attributes which are only needed while
+        # running, e.g. when sending the check to another process
+        state = self.__dict__.copy()
+        for key in ["context", "state_builder", "predict_model",
+                    "validate_model", "timer"]:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.context = None
+        self.state_builder = None
+        self.timer = StageTimer()
 
     def _handle_limits(self):
-        from yaml import load, Loader
-        limits_file = os.path.join(TASK_DATA, 'acis_thermal_check', 
-                                   'data', 'limits.yml')
-        with open(limits_file, "r") as f:
-            limits = load(f, Loader=Loader)[self.msid]
+        limits = get_limits(self.msid)
         for k, v in limits.items():
             setattr(self, f"{k}_limit", v)
 
-    def run(self, args, override_limits=None):
+    def set_limits(self, limits):
+        """
+        Override some of the limits of this check. THIS SHOULD
+        ONLY BE USED FOR TESTING.
+
+        Parameters
+        ----------
+        limits : dict
+            The new values of the limits, keyed by the names of the
+            limits, either as in limits.yml (e.g. "plan_hi") or as the
+            attribute names (e.g. "plan_hi_limit").
+        """
+        for k, v in limits.items():
+            name = k if k.endswith("_limit") else f"{k}_limit"
+            if hasattr(self, name):
+                limit = getattr(self, name)
+                mylog.warning("Replacing %s %.2f with %.2f" % (name, limit, v))
+                setattr(self, name, v)
+
+    def run(self, args, override_limits=None, context=None):
         """
         The main interface to all of ACISThermalCheck's functions.
         This method must be called by the particular thermal model
@@ -133,9 +218,36 @@ class ACISThermalCheck(object):
             in this dictionary. SHOULD ONLY BE USED FOR TESTING.
             This is deliberately hidden from command-line operation
             to avoid it being used accidentally.
+        context : RunContext, optional
+            The context holding the telemetry, ephemeris, and states
+            shared with other models run for the same load. Default:
+            None, which creates a new context for this run only.
+
+        Returns
+        -------
+        A dictionary with the prediction and validation violations
+        and any processing errors.
         """
-        # First, record the selected state builder in the class attributes
-        self.state_builder = make_state_builder(args.state_builder, args)
+        from cxotime import CxoTime
+
+        # Turn on the on-disk cache, if requested
+        if args.cache_dir is not None:
+            set_cache_dir(args.cache_dir)
+
+        # Time each stage of the run, and profile them if requested
+        self.timer = StageTimer(profile_dir=args.outdir if args.profile else None)
+
+        # First, record the run context and the selected state builder
+        # in the class attributes
+        if context is None:
+            with self.timer.stage("run_context"):
+                context = RunContext(args)
+        self.context = context
+        self.state_builder = context.state_builder
+
+        self.plot_nprocs = args.plot_nprocs
+        self.data_only = args.data_only
+        self.write_npz = args.write_npz
 
         proc = self._setup_proc_and_logger(args)
 
@@ -143,11 +255,7 @@ class ACISThermalCheck(object):
         # for a particular model run. THIS SHOULD ONLY BE USED FOR
         # TESTING PURPOSES.
         if override_limits is not None:
-            for k, v in override_limits.items():
-                if hasattr(self, k):
-                    limit = getattr(self, k)
-                    mylog.warning("Replacing %s %.2f with %.2f" % (k, limit, v))
-                    setattr(self, k, v)
+            self.set_limits(override_limits)
 
         # Determine the start and stop times either from whatever was
         # stored in state_builder or punt by using NOW and None for
@@ -164,12 +272,38 @@ class ACISThermalCheck(object):
 
         # Get the telemetry values which will be used
         # for prediction and validation. Args default value is 21 days.
-        tlm = self.get_telem_values(min(tstart, tnow), days=args.days)
+        with self.timer.stage("telemetry"):
+            tlm = self.get_telem_values(min(tstart, tnow), days=args.days)
+
+        # If we are only monitoring the validation of the model, compute
+        # the validation statistics and violations and stop there
+        if args.valid_stats_only:
+            with self.timer.stage("validation"):
+                _, valid_viols = self.run_validation_stats(tlm, args.model_spec,
+                                                           args.outdir,
+                                                           args.run_start, proc)
+            self._write_timings(args.outdir)
+            return {'any_viols': 0,
+                    'viols': None,
+                    'ensemble': None,
+                    'valid_viols': valid_viols,
+                    'errors': proc["errors"]}
 
         # make predictions on a backstop file if defined
         if args.backstop_file is not None:
-            pred = self.make_week_predict(tstart, tstop, tlm, args.T_init,
-                                          args.model_spec, args.outdir)
+            with self.timer.stage("prediction"):
+                pred = self.make_week_predict(tstart, tstop, tlm, args.T_init,
+                                              args.model_spec, args.outdir)
+            # Optionally run an ensemble of predictions with perturbed
+            # initial temperatures and model parameters
+            if args.ensemble_size > 0:
+                with self.timer.stage("ensemble"):
+                    pred["ensemble"] = self.make_ensemble_predict(
+                        pred["states"], pred["state0"], tstop, args.model_spec,
+                        args.outdir, tstart, args.ensemble_size,
+                        T_init_sigma=args.ensemble_T_sigma,
+                        par_sigma=args.ensemble_par_sigma,
+                        seed=args.ensemble_seed, nprocs=args.ensemble_nprocs)
         else:
             pred = defaultdict(lambda: None)
 
@@ -177,10 +311,17 @@ class ACISThermalCheck(object):
 
         if not args.pred_only:
 
-            # Make the validation plots
-            plots_validation = self.make_validation_plots(tlm, args.model_spec,
-                                                          args.outdir,
-                                                          args.run_start)
+            # Make the validation plots, or only compute the
+            # validation statistics if we are not making plots
+            with self.timer.stage("validation"):
+                if self.data_only:
+                    plots_validation = self.make_validation_stats(tlm, args.model_spec,
+                                                                  args.outdir,
+                                                                  args.run_start)
+                else:
+                    plots_validation = self.make_validation_plots(tlm, args.model_spec,
+                                                                  args.outdir,
+                                                                  args.run_start)
 
             proc["op"] = [op_map[op] for op in self.hist_ops]
 
@@ -194,35 +335,69 @@ class ACISThermalCheck(object):
             valid_viols = defaultdict(lambda: None)
             plots_validation = defaultdict(lambda: None)
 
-        any_viols = sum(len(viol["values"]) for viol in pred["viols"].values())
+        if args.backstop_file is not None:
+            any_viols = sum(len(viol["values"]) for viol in pred["viols"].values())
+        else:
+            any_viols = 0
+
+        results = {'any_viols': any_viols,
+                   'viols': pred["viols"],
+                   'ensemble': pred.get("ensemble"),
+                   'valid_viols': None if args.pred_only else valid_viols,
+                   'errors': proc["errors"]}
+
+        # If we are not making plots, write the results as data
+        # files instead of the web page
+        if self.data_only:
+            with self.timer.stage("write_results"):
+                self.write_results(args.outdir, proc, pred, results,
+                                   None if args.pred_only else plots_validation)
+            self._write_timings(args.outdir)
+            return results
 
         # Write everything to the web page.
         # First, write the reStructuredText file.
 
         # Set up the context for the reST file
-        context = {'bsdir': self.bsdir,
-                   'viols': pred["viols"],
-                   'plots': pred["plots"],
-                   'any_viols': any_viols,
-                   'valid_viols': valid_viols,
-                   'proc': proc,
-                   'pred_only': args.pred_only,
-                   'plots_validation': plots_validation}
-
-        self.write_index_rst(args.outdir, context)
+        report_context = {'bsdir': self.bsdir,
+                          'viols': pred["viols"],
+                          'plots': pred["plots"],
+                          'any_viols': any_viols,
+                          'valid_viols': valid_viols,
+                          'proc': proc,
+                          'pred_only': args.pred_only,
+                          'plots_validation': plots_validation}
+
+        with self.timer.stage("render_rst"):
+            self.write_index_rst(args.outdir, report_context)
 
         # Second, convert reST to HTML
-        self.rst_to_html(args.outdir, proc)
+        with self.timer.stage("render_html"):
+            self.rst_to_html(args.outdir, proc)
+
+        self._write_timings(args.outdir)
+
+        return results
 
-        return
+    def _write_timings(self, outdir):
+        # Log the timings of the stages of the run to run.dat
+        # and write them to timings.json
+        self.timer.log()
+        self.timer.write(outdir)
+
+    def _get_context(self):
+        # Outside of run, a context is created the first time one is
+        # needed, and then kept so that later calls reuse it
+        if self.context is None:
+            self.context = RunContext()
+        return self.context
 
     def get_ephemeris(self, start, stop, times):
-        msids = ['orbitephem0_{}'.format(axis) for axis in "xyz"]
-        msids += ['solarephem0_{}'.format(axis) for axis in "xyz"]
-        e = fetch.MSIDset(msids, start - 2000.0, stop + 2000.0)
+        import Ska.Numpy
+        e = self._get_context().fetch_ephemeris(start - 2000.0, stop + 2000.0)
         ephem = {}
-        for msid in msids:
-            ephem[msid] = Ska.Numpy.interpolate(e[msid].vals, e[msid].times,
+        for msid, (msid_times, msid_vals) in e.items():
+            ephem[msid] = Ska.Numpy.interpolate(msid_vals, msid_times,
                                                 times)
         return ephem
 
@@ -239,12 +414,14 @@ class ACISThermalCheck(object):
             The initial temperature of the model prediction. If None, an
             initial value will be constructed from telemetry.
         """
+        from cxotime import CxoTime
+
         # The -5 here has us back off from the last telemetry
         # reading just a bit
         tbegin = CxoTime(tlm['date'][-5]).date
         # Call the overloaded state_builder method to assemble states
         # and define a state0
-        states, state0 = self.state_builder.get_prediction_states(tbegin)
+        states, state0 = self.context.get_prediction_states(tbegin)
 
         # We now determine the initial temperature.
 
@@ -284,7 +461,8 @@ class ACISThermalCheck(object):
         mylog.info('Calculating %s thermal model' % self.name.upper())
 
         # Get commanded states and set initial temperature
-        states, state0 = self.get_states(tlm, T_init)
+        with self.timer.stage("states"):
+            states, state0 = self.get_states(tlm, T_init)
 
         # calc_model actually does the model calculation by running
         # model-specific code.
@@ -293,28 +471,176 @@ class ACISThermalCheck(object):
 
         self.predict_model = model
 
-        # Make the limit check plots and data files
-        plt.rc("axes", labelsize=14, titlesize=16, linewidth=1.5)
-        plt.rc("xtick", labelsize=14)
-        plt.rc("xtick.major", width=1.5, size=4)
-        plt.rc("xtick.minor", width=1.5, size=2)
-        plt.rc("ytick", labelsize=14)
-        plt.rc("ytick.major", width=1.5, size=4)
-        plt.rc("grid", linewidth=1.5)
-
         temps = {self.name: model.comp[self.msid].mvals}
-        # make_prediction_plots runs the validation of the model against previous telemetry
-        plots = self.make_prediction_plots(outdir, states, temps, tstart)
+
+        # Make the limit check plots, unless we are only writing data
+        if self.data_only:
+            plots = None
+        else:
+            plt = get_pyplot()
+            plt.rc("axes", labelsize=14, titlesize=16, linewidth=1.5)
+            plt.rc("xtick", labelsize=14)
+            plt.rc("xtick.major", width=1.5, size=4)
+            plt.rc("xtick.minor", width=1.5, size=2)
+            plt.rc("ytick", labelsize=14)
+            plt.rc("ytick.major", width=1.5, size=4)
+            plt.rc("grid", linewidth=1.5)
+            # make_prediction_plots runs the validation of the model against previous telemetry
+            with self.timer.stage("plots"):
+                plots = self.make_prediction_plots(outdir, states, temps, tstart)
 
         # make_prediction_viols determines the violations and prints them out
-        viols = self.make_prediction_viols(temps, tstart)
-        # write_states writes the commanded states to states.dat
-        self.write_states(outdir, states)
-        # write_temps writes the temperatures to temperatures.dat
-        self.write_temps(outdir, model.times, temps)
+        with self.timer.stage("viols"):
+            viols = self.make_prediction_viols(temps, tstart)
+        with self.timer.stage("write_outputs"):
+            # write_states writes the commanded states to states.dat
+            self.write_states(outdir, states)
+            # write_temps writes the temperatures to temperatures.dat
+            self.write_temps(outdir, model.times, temps)
+
+        return dict(states=states, state0=state0, times=model.times,
+                    temps=temps, plots=plots, viols=viols)
+
+    def make_ensemble_predict(self, states, state0, tstop, model_spec, outdir,
+                              load_start, nmembers, T_init_sigma=1.0,
+                              par_sigma=0.01, seed=None, nprocs=1):
+        """
+        Run an ensemble of thermal model predictions with perturbed
+        initial temperatures and model parameters, and determine the
+        probability of violating each limit and the envelope of the
+        predicted temperatures. The states, ephemeris, and pitch and
+        roll are computed once and shared by all of the members. The
+        results are written to "ensemble.json" and "ensemble.npz".
 
-        return dict(states=states, times=model.times, temps=temps,
-                    plots=plots, viols=viols)
+        Parameters
+        ----------
+        states : NumPy record array
+            Commanded states
+        state0 : dict
+            The initial state, including the initial temperature.
+        tstop : float
+            The stop time of the model run in seconds from the beginning
+            of the mission.
+        model_spec : string
+            The path to the thermal model specification.
+        outdir : string
+            The directory to write outputs to.
+        load_start : float
+            The start time of the load, used so that we only check for
+            violations for times later than this time for the model run.
+        nmembers : integer
+            The number of members of the ensemble.
+        T_init_sigma : float, optional
+            The standard deviation of the initial temperature in degC.
+            Default: 1.0
+        par_sigma : float, optional
+            The standard deviation of each model parameter which is not
+            frozen in the model specification, as a fraction of its value.
+            The perturbed values are kept within the parameter's minimum
+            and maximum. Default: 0.01
+        seed : integer, optional
+            The seed for the random number generator. Default: None
+        nprocs : integer, optional
+            The number of processes to use. Default: 1
+
+        Returns
+        -------
+        A dictionary with the probability that each limit is violated
+        during the load, keyed by the limit name.
+        """
+        import json
+        mylog.info('Calculating %s thermal model ensemble of %d members' %
+                   (self.name.upper(), nmembers))
+
+        # Compute the inputs which are shared by all of the members
+        prepared = self.prepare_model(model_spec, states, state0['tstart'],
+                                      tstop, state0=state0)
+        prepared.prepare()
+        spec = prepared.model_spec
+
+        # Draw the initial temperatures and the parameters of the members
+        rng = np.random.default_rng(seed)
+        T_inits = state0[self.msid] + T_init_sigma*rng.standard_normal(nmembers)
+        free_pars = [i for i, par in enumerate(spec["pars"]) if not par["frozen"]]
+        members = []
+        for T_init in T_inits:
+            pars = [dict(par) for par in spec["pars"]]
+            for i in free_pars:
+                val = pars[i]["val"]*(1.0 + par_sigma*rng.standard_normal())
+                pars[i]["val"] = float(np.clip(val, pars[i]["min"], pars[i]["max"]))
+            members.append((float(T_init), pars))
+
+        times = prepared.times
+        nprocs = min(nprocs, nmembers)
+        if nprocs <= 1:
+            _init_ensemble_worker(prepared)
+            try:
+                temps = _run_ensemble_members(members)
+            finally:
+                _init_ensemble_worker(None)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            # Each process runs a batch of members, so the prepared model
+            # is only sent once to each process
+            batches = [members[i::nprocs] for i in range(nprocs)]
+            with ProcessPoolExecutor(max_workers=nprocs,
+                                     initializer=_init_ensemble_worker,
+                                     initargs=(prepared,)) as executor:
+                results = list(executor.map(_run_ensemble_members, batches))
+            temps = np.empty((nmembers, times.size))
+            for i, result in enumerate(results):
+                temps[i::nprocs] = result
+
+        # Determine the probability of violating each limit, both
+        # during the load and at each time, using the same limits
+        # as for the nominal prediction
+        limits = self._get_prediction_limits(times, self.predict_model.comp[self.msid].mvals,
+                                             load_start)
+        nviols = dict.fromkeys([limit[0] for limit in limits], 0)
+        for temp in temps:
+            limit_viols = find_limit_violations(times, temp, load_start, limits)
+            for name in nviols:
+                nviols[name] += len(limit_viols[name]) > 0
+        in_load = times >= load_start
+        viol_prob = {}
+        prob = {}
+        for name, limit, lim_type, mask in limits:
+            viol_prob[name] = nviols[name] / nmembers
+            # A temperature which is at the limit is a violation, as
+            # in find_limit_violations
+            if lim_type == "max":
+                exceed = temps >= limit
+            else:
+                exceed = temps <= limit
+            exceed &= in_load
+            if mask is not None:
+                exceed &= mask
+            prob[name] = exceed.mean(axis=0)
+            mylog.info('Probability of violating the %s limit of %.2f degC: %.3f' %
+                       (name, limit, viol_prob[name]))
+
+        percentiles = np.array([1, 5, 16, 50, 84, 95, 99])
+        outfile = os.path.join(outdir, 'ensemble.npz')
+        mylog.info('Writing ensemble temperature envelopes to %s' % outfile)
+        np.savez(outfile, times=times, percentiles=percentiles,
+                 envelope=np.percentile(temps, percentiles, axis=0),
+                 mean=temps.mean(axis=0), min=temps.min(axis=0),
+                 max=temps.max(axis=0),
+                 **{"prob_%s" % name: p for name, p in prob.items()})
+
+        outfile = os.path.join(outdir, 'ensemble.json')
+        mylog.info('Writing ensemble results to %s' % outfile)
+        summary = {"nmembers": nmembers,
+                   "T_init": float(state0[self.msid]),
+                   "T_init_sigma": T_init_sigma,
+                   "par_sigma": par_sigma,
+                   "seed": seed,
+                   "pars": [spec["pars"][i]["full_name"] for i in free_pars],
+                   "viol_prob": viol_prob}
+        with open(outfile, "w") as f:
+            json.dump(summary, f, indent=4)
+
+        return viol_prob
 
     def _calc_model_supp(self, model, state_times, states, ephem, state0):
         pass
@@ -339,27 +665,77 @@ class ACISThermalCheck(object):
             indexed by MSID name so that more than one can be input if
             necessary.
         """
-        import xija
-        model = xija.ThermalModel(self.name, start=tstart, stop=tstop,
-                                  model_spec=model_spec)
-        ephem = self.get_ephemeris(tstart, tstop, model.times)
+        prepared = self.prepare_model(model_spec, states, tstart, tstop,
+                                      state0=state0)
+        return prepared.run()
+
+    def prepare_model(self, model_spec, states, tstart, tstop, state0=None):
+        """
+        Set up the inputs of the model, which can then be run (and
+        run again with different states, initial state, or times)
+        with the ``run`` method of the returned object.
+
+        Parameters
+        ----------
+        model_spec : string or dict
+            Path to the JSON file containing the model specification,
+            or the model specification itself.
+        states : NumPy record array
+            Commanded states
+        tstart : float
+            The start time of the model run.
+        tstop : float
+            The end time of the model run.
+        state0 : dict, optional
+            This is used to set the initial temperature. It's a dictionary
+            indexed by MSID name so that more than one can be input if
+            necessary.
+
+        Returns
+        -------
+        A :class:`~acis_thermal_check.prepared_model.PreparedModel` object.
+        """
+        return PreparedModel(self, model_spec, states, tstart, tstop,
+                             state0=state0)
+
+    def get_dh_heater(self, state0):
+        """
+        Get the history of the detector housing heater, for the
+        models which need it.
+
+        Parameters
+        ----------
+        state0 : dict
+            The initial state of the model run. The heater is only
+            used for model runs with an initial state.
+
+        Returns
+        -------
+        A 2-tuple of NumPy arrays (times and heater on/off states), or
+        None if this model run does not use the heater.
+        """
+        if self.name not in ["psmc", "acisfp"] or state0 is None:
+            return None
+        # Detector housing heater contribution to heating
+        htrbfn = os.path.join(TASK_DATA, 'acis_thermal_check', 'data',
+                              'dahtbon_history.rdb')
+        return read_dh_heater_history(htrbfn)
+
+    def _setup_model(self, model, states, state0, ephem, pitch, roll,
+                     dh_heater=None):
+        # Set the data of the model components from the states,
+        # ephemeris, pitch and roll, and heater history which have
+        # been computed for the model times
         state_times = np.array([states['tstart'], states['tstop']])
         model.comp['sim_z'].set_data(states['simpos'], state_times)
         model.comp['eclipse'].set_data(False)
         for name in ('ccd_count', 'fep_count', 'vid_board', 'clocking'):
             model.comp[name].set_data(states[name], state_times)
-        pitch, roll = calc_pitch_roll(model.times, ephem, states)
         model.comp['roll'].set_data(roll, model.times)
         model.comp['pitch'].set_data(pitch, model.times)
 
-        if self.name in ["psmc", "acisfp"] and state0 is not None:
-            # Detector housing heater contribution to heating
-            htrbfn = os.path.join(TASK_DATA, 'acis_thermal_check', 'data',
-                                  'dahtbon_history.rdb')
-            mylog.info('Reading file of dahtrb commands from file %s' % htrbfn)
-            htrb = ascii.read(htrbfn, format='rdb')
-            dh_heater_times = CxoTime(htrb['time']).secs
-            dh_heater = htrb['dahtbon'].astype(bool)
+        if dh_heater is not None:
+            dh_heater_times, dh_heater = dh_heater
             model.comp['dh_heater'].set_data(dh_heater, dh_heater_times)
 
         if state0 is not None:
@@ -367,11 +743,6 @@ class ACISThermalCheck(object):
 
         self._calc_model_supp(model, state_times, states, ephem, state0)
 
-        model.make()
-        model.calc()
-
-        return model
-
     def make_validation_viols(self, plots_validation):
         """
         Find limit violations where MSID quantile values are outside the
@@ -417,59 +788,43 @@ class ACISThermalCheck(object):
 
         return viols
 
-    def _make_prediction_viols(self, times, temp, load_start, limit, lim_name,
-                               lim_type, mask=None):
-        if mask is None:
-            mask = np.ones_like(temp, dtype='bool')
+    def _report_prediction_viols(self, limit_viols, limit, lim_name):
+        # Convert violations found by find_limit_violations into the
+        # list of dicts used in the report, and log them
         viols = []
-        if lim_type == "min":
-            bad = (temp <= limit) & mask
-        elif lim_type == "max":
-            bad = (temp >= limit) & mask
-        op = getattr(np, lim_type)
-        # The NumPy black magic of the next two lines is to figure
-        # out which time periods have planning limit violations and
-        # to find the bounding indexes of these times. This will also
-        # find violations which happen for one discrete time value also.
-        bad = np.concatenate(([False], bad, [False]))
-        changes = np.flatnonzero(bad[1:] != bad[:-1]).reshape(-1, 2)
-        # Now go through the periods where the temperature violates
-        # the planning limit and flag the duration and maximum of
-        # the violation
-        for change in changes:
-            # Only report violations which occur after the load being
-            # reviewed starts.
-            in_load = times[change[0]] > load_start or \
-                      (times[change[0]] < load_start < times[change[1]])
-            if times[change[0]] > load_start:
-                tstart = times[change[0]]
-            else:
-                tstart = load_start
-            tstop = times[change[1] - 1]
-            datestart = CxoTime(tstart).date
-            datestop = CxoTime(tstop).date
-            duration = tstop - tstart
-            # Only count the violation if it's in the load
-            # and if the duration is more than 10s
-            if in_load and duration >= 10.0:
-                viol = {'datestart': datestart,
-                        'datestop': datestop,
-                        'duration': duration*1.0e-3,
-                        'extemp': op(temp[change[0]:change[1]])}
-                mylog.info('WARNING: %s violates %s limit ' % (self.msid,
-                                                               lim_name) +
-                           'of %.2f degC from %s to %s' % (limit,
-                                                           viol['datestart'],
-                                                           viol['datestop']))
-                viols.append(viol)
+        for viol in limit_viols:
+            viol = {'datestart': str(viol['datestart']),
+                    'datestop': str(viol['datestop']),
+                    'tstart': float(viol['tstart']),
+                    'tstop': float(viol['tstop']),
+                    'duration': float(viol['duration']),
+                    'extemp': float(viol['extemp'])}
+            mylog.info('WARNING: %s violates %s limit ' % (self.msid,
+                                                           lim_name) +
+                       'of %.2f degC from %s to %s' % (limit,
+                                                       viol['datestart'],
+                                                       viol['datestop']))
+            viols.append(viol)
 
         return viols
 
+    def _make_prediction_viols(self, times, temp, load_start, limit, lim_name,
+                               lim_type, mask=None):
+        limit_viols = find_violations(times, temp, load_start, limit,
+                                      lim_type, mask=mask)
+        return self._report_prediction_viols(limit_viols, limit, lim_name)
+
     def make_prediction_viols(self, temps, load_start):
         """
         Find limit violations where predicted temperature is above the
         yellow limit minus margin.
 
+        All of the limits, including any added by a subclass in
+        ``custom_prediction_limits``, are checked in a single pass
+        over the temperatures. The violations of each limit are stored
+        in the ``limit_viols`` attribute, keyed by the limit name, so
+        that ``custom_prediction_viols`` can use them.
+
         Parameters
         ----------
         temps : dict of NumPy arrays
@@ -484,22 +839,24 @@ class ACISThermalCheck(object):
         temp = temps[self.name]
         times = self.predict_model.times
 
-        hi_viols = self._make_prediction_viols(times, temp, load_start,
-                                               self.plan_hi_limit,
-                                               "planning", "max")
+        limits = self._get_prediction_limits(times, temp, load_start)
+        limit_viols = find_limit_violations(times, temp, load_start, limits)
+        self.limit_viols = {}
+        for name, limit, lim_type, mask in limits:
+            lim_name = "planning" if name in ["hi", "lo"] else name
+            self.limit_viols[name] = \
+                self._report_prediction_viols(limit_viols[name], limit, lim_name)
+
         viols = {"hi":
                      {"name": f"Hot ({self.plan_hi_limit} C)",
                       "type": "Max",
-                      "values": hi_viols}
+                      "values": self.limit_viols["hi"]}
                  }
 
         if self.flag_cold_viols:
-            lo_viols = self._make_prediction_viols(times, temp, load_start,
-                                                   self.plan_lo_limit,
-                                                   "planning", "min")
             viols["lo"] = {"name": f"Cold ({self.plan_lo_limit} C)",
                            "type": "Min",
-                           "values": lo_viols}
+                           "values": self.limit_viols["lo"]}
 
         # Handle any additional violations one wants to check,
         # can be overridden by a subclass
@@ -507,6 +864,41 @@ class ACISThermalCheck(object):
 
         return viols
 
+    def _get_prediction_limits(self, times, temp, load_start):
+        # The planning limits, plus any limits added by a subclass
+        limits = [("hi", self.plan_hi_limit, "max", None)]
+        if self.flag_cold_viols:
+            limits.append(("lo", self.plan_lo_limit, "min", None))
+        limits += self.custom_prediction_limits(times, temp, load_start)
+        return limits
+
+    def custom_prediction_limits(self, times, temp, load_start):
+        """
+        This method is here to allow a subclass to add its own
+        limits, which are checked in the same pass over the
+        temperatures as the planning limits. The violations of
+        these limits can be found in the ``limit_viols`` attribute
+        in ``custom_prediction_viols``.
+
+        Parameters
+        ----------
+        times : NumPy array
+            The times for the predicted temperatures
+        temp : NumPy array
+            The predicted temperatures
+        load_start : float
+            The start time of the load, used so that we only report
+            violations for times later than this time for the model
+            run.
+
+        Returns
+        -------
+        A list of (name, limit, lim_type, mask) tuples, where
+        *lim_type* is "max" or "min" and *mask* is either None or a
+        boolean array which is True where the limit applies.
+        """
+        return []
+
     def custom_prediction_viols(self, times, temp, viols, load_start):
         """
         This method is here to allow a subclass
@@ -529,7 +921,8 @@ class ACISThermalCheck(object):
 
     def write_states(self, outdir, states):
         """
-        Write the states record array to the file "states.dat".
+        Write the states record array to the file "states.dat", and,
+        if requested, to the binary file "states.npz".
 
         Parameters
         ----------
@@ -538,18 +931,34 @@ class ACISThermalCheck(object):
         states : NumPy record array
             The commanded states to be written to the file.
         """
+        from astropy.table import Table
         outfile = os.path.join(outdir, 'states.dat')
         mylog.info('Writing states to %s' % outfile)
         states_table = Table(states, copy=False)
+        # Columns of objects, e.g. the transition keys of the
+        # states, are written as their string values
+        for name in states_table.colnames:
+            if states_table[name].dtype.kind == "O":
+                states_table[name] = states_table[name].astype(str)
         states_table['pitch'].format = '%.2f'
         states_table['tstart'].format = '%.2f'
         states_table['tstop'].format = '%.2f'
+        # The fast writer may quote strings differently from the Python
+        # writer, so it is only used if none of the strings need quoting
+        fast_writer = all(_is_plain_string_column(states_table[name])
+                          for name in states_table.colnames
+                          if states_table[name].dtype.kind in "SU")
         states_table.write(outfile, format='ascii', delimiter='\t', overwrite=True,
-                           fast_writer=False)
+                           fast_writer=fast_writer)
+        if self.write_npz:
+            self._write_npz(os.path.join(outdir, 'states.npz'),
+                            {name: states_table[name] for name in states_table.colnames})
 
     def write_temps(self, outdir, times, temps):
         """
-        Write the states record array to the file "temperatures.dat".
+        Write the states record array to the file "temperatures.dat",
+        and, if requested, the times and temperatures to the binary
+        file "temperatures.npz".
 
         Parameters
         ----------
@@ -560,6 +969,8 @@ class ACISThermalCheck(object):
         temps : NumPy array
             Temperatures in Celsius
         """
+        from astropy.table import Table
+        from cxotime import CxoTime
         outfile = os.path.join(outdir, 'temperatures.dat')
         mylog.info('Writing temperatures to %s' % outfile)
         T = temps[self.name]
@@ -569,9 +980,127 @@ class ACISThermalCheck(object):
         temp_table['time'].format = '%.2f'
         temp_table[self.msid].format = '%.2f'
         temp_table.write(outfile, format='ascii', delimiter='\t', overwrite=True)
+        if self.write_npz:
+            self._write_npz(os.path.join(outdir, 'temperatures.npz'),
+                            {'time': times, self.msid: T})
+
+    def _write_npz(self, outfile, columns):
+        # Write columns of data to a binary NPZ file, with strings
+        # in place of any objects
+        mylog.info('Writing %s' % outfile)
+        arrays = {}
+        for name, col in columns.items():
+            col = np.asarray(col)
+            if col.dtype.kind == "O":
+                col = col.astype(str)
+            arrays[name] = col
+        np.savez(outfile, **arrays)
+
+    def write_results(self, outdir, proc, pred, results, valid_stats):
+        """
+        Write the results of a run without plots as data files,
+        instead of the web page. The violations, the processing
+        information, and the validation statistics are written to
+        "results.json", and the predicted temperatures are written
+        to "results.npz".
+
+        Parameters
+        ----------
+        outdir : string
+            The directory the files will be written to.
+        proc : dict
+            The processing information for this run.
+        pred : dict
+            The outputs of the prediction, from :meth:`make_week_predict`.
+        results : dict
+            The violations and errors, as returned by :meth:`run`.
+        valid_stats : list of dicts
+            The validation statistics for each MSID, from
+            :meth:`make_validation_stats`, or None if there was no
+            validation.
+        """
+        import json
+
+        outfile = os.path.join(outdir, 'results.json')
+        mylog.info('Writing results to %s' % outfile)
+        output = dict(results)
+        output['proc'] = proc
+        output['bsdir'] = self.bsdir
+        output['valid_stats'] = valid_stats
+        with open(outfile, "w") as f:
+            json.dump(output, f, indent=4, default=_to_json)
+
+        if pred["times"] is not None:
+            outfile = os.path.join(outdir, 'results.npz')
+            mylog.info('Writing temperatures to %s' % outfile)
+            np.savez(outfile, times=pred["times"], **pred["temps"])
+
+    def write_validation_results(self, outdir, proc, valid_stats, valid_viols):
+        """
+        Write the validation statistics and violations of a run which
+        only computes the validation statistics to "validation.json".
+
+        Parameters
+        ----------
+        outdir : string
+            The directory the file will be written to.
+        proc : dict
+            The processing information for this run.
+        valid_stats : list of dicts
+            The validation statistics for each MSID, from
+            :meth:`make_validation_stats`.
+        valid_viols : list of dicts
+            The validation violations, from :meth:`make_validation_viols`.
+        """
+        import json
+        outfile = os.path.join(outdir, 'validation.json')
+        mylog.info('Writing validation results to %s' % outfile)
+        output = {'proc': proc,
+                  'valid_stats': valid_stats,
+                  'valid_viols': valid_viols,
+                  'any_valid_viols': len(valid_viols) > 0}
+        with open(outfile, "w") as f:
+            json.dump(output, f, indent=4, default=_to_json)
+
+    def run_validation_stats(self, tlm, model_spec, outdir, run_start, proc):
+        """
+        Only validate the model: compute the statistics of the
+        residuals between the model and the telemetry and the
+        validation violations, and write them to "validation_quant.csv"
+        and "validation.json", without making any plots, predictions,
+        or the web page.
+
+        Parameters
+        ----------
+        tlm : NumPy record array
+            NumPy record array of telemetry
+        model_spec : string
+            The path to the thermal model specification.
+        outdir : string
+            The directory to write outputs to.
+        run_start : string
+            The starting date/time of the run.
+        proc : dict
+            The processing information for this run.
+
+        Returns
+        -------
+        A tuple of the validation statistics for each MSID and the
+        validation violations.
+        """
+        valid_stats = self.make_validation_stats(tlm, model_spec, outdir,
+                                                 run_start)
+        proc["op"] = [op_map[op] for op in self.hist_ops]
+        valid_viols = self.make_validation_viols(valid_stats)
+        if len(valid_viols) > 0:
+            mylog.info('validation warning(s) in output at %s' % outdir)
+        self.write_validation_results(outdir, proc, valid_stats, valid_viols)
+        return valid_stats, valid_viols
 
     def _gather_perigee(self, run_start, load_start):
         import glob
+        from kadi import events
+
         # The first step is to build a list of all the perigee passages.
 
         # Gather the perigee passages that occur from the
@@ -627,6 +1156,7 @@ class ACISThermalCheck(object):
 
     def _make_state_plots(self, plots, num_figs, w1, plot_start,
                           states, load_start, figsize=(12, 6)):
+        from Ska.Matplotlib import pointpair
         # Make a plot of ACIS CCDs and SIM-Z position
         plots['pow_sim'] = plot_two(
             fig_id=num_figs+1,
@@ -678,6 +1208,8 @@ class ACISThermalCheck(object):
             The start time of the load in seconds from the beginning of the
             mission.
         """
+        from Ska.Matplotlib import cxctime2plotdate
+
         plots = {}
 
         times = self.predict_model.times
@@ -692,13 +1224,14 @@ class ACISThermalCheck(object):
 
         w1 = None
         mylog.info('Making temperature prediction plots')
-        plots[self.name] = plot_two(fig_id=1, x=times, y=temps[self.name],
-                                    x2=times,
-                                    y2=self.predict_model.comp["pitch"].mvals,
-                                    xmin=plot_start, xlabel='Date', 
-                                    ylabel='Temperature ($^\circ$C)',
-                                    ylabel2='Pitch (deg)', ylim2=(40, 180),
-                                    width=w1, load_start=load_start)
+        with self.timer.stage(self.msid.lower()):
+            plots[self.name] = plot_two(fig_id=1, x=times, y=temps[self.name],
+                                        x2=times,
+                                        y2=self.predict_model.comp["pitch"].mvals,
+                                        xmin=plot_start, xlabel='Date', 
+                                        ylabel='Temperature ($^\circ$C)',
+                                        ylabel2='Pitch (deg)', ylim2=(40, 180),
+                                        width=w1, load_start=load_start)
         # Add horizontal lines for the planning and caution limits
         ymin, ymax = plots[self.name]['ax'].get_ylim()
         ymax = max(self.yellow_hi_limit+1, ymax)
@@ -720,8 +1253,9 @@ class ACISThermalCheck(object):
         # of all the weekly prediction plots are the same.
         w1, _ = plots[self.name]['fig'].get_size_inches()
 
-        self._make_state_plots(plots, 1, w1, plot_start,
-                               states, load_start)
+        with self.timer.stage("state_plots"):
+            self._make_state_plots(plots, 1, w1, plot_start,
+                                   states, load_start)
 
         plots['default'] = plots[self.name]
 
@@ -742,11 +1276,9 @@ class ACISThermalCheck(object):
 
         # Now write all of the plots after possible
         # customizations have been made
-        for key in plots:
-            if key != self.msid:
-                outfile = os.path.join(outdir, plots[key]['filename'])
-                mylog.info('Writing plot file %s' % outfile)
-                plots[key]['fig'].savefig(outfile)
+        figures = [(plots[key]['fig'], os.path.join(outdir, plots[key]['filename']))
+                   for key in plots if key != self.msid]
+        save_figures(figures, nprocs=self.plot_nprocs, timer=self.timer)
 
         return plots
 
@@ -790,11 +1322,11 @@ class ACISThermalCheck(object):
             masks.append(mask)
         return masks
 
-    def make_validation_plots(self, tlm, model_spec, outdir, run_start):
+    def calc_validation(self, tlm, model_spec):
         """
-        Make validation output plots by running the thermal model from a
-        time in the past forward to the present and compare it to real
-        telemetry
+        Run the thermal model from a time in the past forward to the
+        present and compute the statistics of the differences between
+        the model and the real telemetry, without making any plots.
 
         Parameters
         ----------
@@ -802,16 +1334,20 @@ class ACISThermalCheck(object):
             NumPy record array of telemetry
         model_spec : string
             The path to the thermal model specification.
-        outdir : string
-            The directory to write outputs to.
-        run_start : string
-            The starting date/time of the run.
-        """
-        import pickle
 
+        Returns
+        -------
+        A dictionary with the model ("model"), the model values and the
+        telemetry interpolated to the model times ("pred" and "tlm"),
+        the mask of times where the validation is valid ("good_mask"),
+        and the statistics of the data - model residuals for each MSID
+        as a :class:`~acis_thermal_check.validation.ResidualStats`
+        ("stats").
+        """
+        import Ska.Numpy
         start = tlm['date'][0]
         stop = tlm['date'][-1]
-        states = self.state_builder.get_validation_states(start, stop)
+        states = self.context.get_validation_states(start, stop)
 
         mylog.info('Calculating %s thermal model for validation' % self.name.upper())
 
@@ -834,14 +1370,6 @@ class ACISThermalCheck(object):
                                      method='nearest')
         tlm = tlm[idxs]
 
-        # Set up labels for validation plots
-        labels = {self.msid: 'Temperature ($^\circ$C)',
-                  'pitch': 'Pitch (deg)',
-                  'tscpos': 'SIM-Z (steps/1000)',
-                  'roll': 'Off-Nominal Roll (deg)'}
-
-        scales = {'tscpos': 1000.}
-
         fmts = {self.msid: '%.2f',
                 'pitch': '%.3f',
                 'tscpos': '%d',
@@ -851,185 +1379,272 @@ class ACISThermalCheck(object):
         # "valid", e.g., not during situations where we expect in
         # advance that telemetry and model data will not match. This
         # is so we do not flag violations during these times
-        good_mask = np.ones(len(tlm), dtype='bool')
         if hasattr(model, "bad_times"):
-            for interval in model.bad_times:
-                bad = ((tlm['date'] >= CxoTime(interval[0]).secs)
-                    & (tlm['date'] < CxoTime(interval[1]).secs))
-                good_mask[bad] = False
-
-        # find perigee passages
-        rzs = events.rad_zones.filter(start, stop)
-
-        plots = []
-        mylog.info('Making %s model validation plots and quantile table' % self.name.upper())
-        quantiles = (1, 5, 16, 50, 84, 95, 99)
-        # store lines of quantile table in a string and write out later
-        quant_table = ''
-        quant_head = ",".join(['MSID'] + ["quant%d" % x for x in quantiles])
-        quant_table += quant_head + "\n"
-        xmin, xmax = cxctime2plotdate(model.times)[[0, -1]]
-        fig_id = 0
-        for msid in pred.keys():
-            plot = dict(msid=msid.upper())
-            fig = plt.figure(10 + fig_id, figsize=(12, 6))
-            fig.clf()
-            scale = scales.get(msid, 1.0)
-            ticklocs, fig, ax = plot_cxctime(model.times, pred[msid] / scale, label='Model',
-                                             fig=fig, ls='-', lw=4, color=thermal_red)
-            ticklocs, fig, ax = plot_cxctime(model.times, tlm[msid] / scale, label='Data',
-                                             fig=fig, ls='-', lw=2, color=thermal_blue)
-            if np.any(~good_mask):
-                ticklocs, fig, ax = plot_cxctime(model.times[~good_mask],
-                                                 tlm[msid][~good_mask] / scale,
-                                                 fig=fig, fmt='.c')
-            ax.set_title(msid.upper() + ' validation', loc='left', pad=10)
-            ax.set_xlabel("Date")
-            ax.set_ylabel(labels[msid])
-            ax.grid()
-            # add lines for perigee passages
-            for rz in rzs:
-                ptimes = cxctime2plotdate([rz.tstart, rz.tstop])
-                for ptime in ptimes:
-                    ax.axvline(ptime, ls='--', color='C2',
-                               linewidth=2, zorder=-10)
-            # Add horizontal lines for the planning and caution limits
-            # or the limits for the focal plane model. Make sure we can
-            # see all of the limits.
-            if self.msid == msid:
-                ymin, ymax = ax.get_ylim()
-                if msid == "fptemp":
-                    ax.axhline(self.cold_ecs_limit, linestyle='--',
-                               color='dodgerblue', label='Cold ECS',
-                               zorder=-8, linewidth=2)
-                    ax.axhline(self.acis_i_limit, linestyle='--',
-                               color='purple', zorder=-8, label='ACIS-I',
-                               linewidth=2)
-                    ax.axhline(self.acis_s_limit, linestyle='--', 
-                               color='blue', zorder=-8, label='ACIS-S',
-                               linewidth=2)
-                    ax.axhline(self.acis_hot_limit, linestyle='--', 
-                               color='red', zorder=-8, label='Hot ACIS',
-                               linewidth=2)
-                    ymax = max(self.acis_hot_limit+1, ymax)
-                else:
-                    ax.axhline(self.yellow_hi_limit, linestyle='-', color='gold',
-                               zorder=-8, linewidth=2, label='Yellow')
-                    ax.axhline(self.plan_hi_limit, linestyle='-', color='C2',
-                               zorder=-8, linewidth=2, label='Planning')
-                    ymax = max(self.yellow_hi_limit+1, ymax)
-                    if self.flag_cold_viols:
-                        ax.axhline(self.yellow_lo_limit, linestyle='-', color='gold', linewidth=2)
-                        ax.axhline(self.plan_lo_limit, linestyle='-', color='C2', linewidth=2)
-                        ymin = min(self.yellow_lo_limit-1, ymin)
-                ax.set_ylim(ymin, ymax)
-            ax.set_xlim(xmin, xmax)
-
-            plot['lines'] = {"fig": fig,
-                             "ax": ax,
-                             "filename": msid + '_valid.png'}
-
-            # Figure out histogram masks
-            if msid == self.msid:
-                masks = self.get_histogram_mask(tlm, self.hist_limit)
-                ok = masks[0] & good_mask
-                # Some models have a second histogram limit
-                if len(self.hist_limit) == 2:
-                    ok2 = masks[1] & good_mask
+            good_mask = ~interval_mask(tlm['date'], model.bad_times)
+        else:
+            good_mask = np.ones(len(tlm), dtype='bool')
+
+        mylog.info('Calculating %s model validation statistics' % self.name.upper())
+        with self.timer.stage("stats"):
+            stats = OrderedDict()
+            for msid in pred.keys():
+                # Figure out histogram masks
+                if msid == self.msid:
+                    masks = self.get_histogram_mask(tlm, self.hist_limit)
+                    ok = masks[0] & good_mask
+                    # Some models have a second histogram limit
+                    if len(self.hist_limit) == 2:
+                        ok2 = masks[1] & good_mask
+                    else:
+                        ok2 = np.zeros(tlm[msid].size, dtype=bool)
                 else:
+                    ok = np.ones(tlm[msid].size, dtype=bool)
                     ok2 = np.zeros(tlm[msid].size, dtype=bool)
-            else:
-                ok = np.ones(tlm[msid].size, dtype=bool)
-                ok2 = np.zeros(tlm[msid].size, dtype=bool)
-            diff = np.sort(tlm[msid][ok] - pred[msid][ok])
-            if ok2.any():
-                diff2 = np.sort(tlm[msid][ok2] - pred[msid][ok2])
-            quant_line = "%s" % msid
-            for quant in quantiles:
-                quant_val = diff[(len(diff) * quant) // 100]
-                plot['quant%02d' % quant] = fmts[msid] % quant_val
-                quant_line += (',' + fmts[msid] % quant_val)
-            quant_table += quant_line + "\n"
-            # We make two histogram plots for each validation,
-            # one with linear and another with log scaling.
-            fig, axes = plt.subplots(ncols=2, num=20+fig_id, figsize=(12.0, 3.5))
-            for i, histscale in enumerate(('log', 'lin')):
-                ax = axes[i]
-                ax.hist(diff / scale, bins=50, log=(histscale == 'log'),
-                        histtype='step', color=thermal_blue, linewidth=2)
+                diff = tlm[msid][ok] - pred[msid][ok]
                 if ok2.any():
-                    ax.hist(diff2 / scale, bins=50, log=(histscale == 'log'),
-                            color=thermal_red, histtype='step', linewidth=2)
-                ax.set_title(msid.upper() + ' residuals: data - model')
-                ax.set_xlabel(labels[msid])
-            fig.subplots_adjust(bottom=0.18, left=0.15, wspace=0.6)
-            plot['hist'] = {'fig': fig,
-                            "ax": ax,
-                            'filename': '%s_valid_hist.png' % msid}
-            fig_id += 1
-            plots.append(plot)
+                    diff2 = tlm[msid][ok2] - pred[msid][ok2]
+                else:
+                    diff2 = None
+                stats[msid] = ResidualStats(msid, diff, diff2=diff2, fmt=fmts[msid])
 
-        fig = plt.figure(10+fig_id, figsize=(12, 6))
-        fig.clf()
-        ticklocs, fig, ax = plot_cxctime(model.times, model.comp['ccd_count'].dvals,
-                                         fig=fig, ls='-', lw=2, color=thermal_blue)
-        ticklocs, fig, ax = plot_cxctime(model.times, model.comp['fep_count'].dvals,
-                                         fig=fig, ls='--', lw=2, color=thermal_blue)
-        ax.set_ylim(0, 6.5)
-        ax.set_title("ACIS CCD/FEPs")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("CCD/FEP Count")
-        ax.grid()
-        ax.set_xlim(xmin, xmax)
-        ax.lines[0].set_label('CCDs')
-        ax.lines[1].set_label('FEPs')
-        # add lines for perigee passages
-        for rz in rzs:
-            ptimes = cxctime2plotdate([rz.tstart, rz.tstop])
-            for ptime in ptimes:
-                ax.axvline(ptime, ls='--', color='C2',
-                           linewidth=2, zorder=-10)
-        ax.legend(fancybox=True, framealpha=0.5, loc=2)
-        plot = {"msid": "ccd_count",
-                "lines": {"fig": fig,
-                          "ax": ax,
-                          "filename": 'ccd_count_valid.png'}
-                }
+        return dict(model=model, pred=pred, tlm=tlm, good_mask=good_mask,
+                    stats=stats)
+
+    def _write_validation_data(self, outdir, run_start, valid):
+        # Write quantile tables to a CSV file
+        filename = os.path.join(outdir, 'validation_quant.csv')
+        mylog.info('Writing quantile table %s' % filename)
+        quant_table = ",".join(['MSID'] + ["quant%d" % x for x in validation_quantiles])
+        quant_table += "\n"
+        for msid, stats in valid["stats"].items():
+            stats = stats.as_dict()
+            quant_table += ",".join([msid] + [stats['quant%02d' % x]
+                                              for x in validation_quantiles])
+            quant_table += "\n"
+        f = open(filename, 'w')
+        f.write(quant_table)
+        f.close()
 
-        plots.append(plot)
+        # If run_start is specified this is likely for regression testing
+        # or other debugging.  In this case write out the full predicted and
+        # telemetered dataset.
+        if run_start:
+            filename = os.path.join(outdir, 'validation_data.npz')
+            mylog.info('Writing validation data %s' % filename)
+            write_validation_data(filename, valid["pred"], valid["tlm"])
 
-        fig_id += 1
+    def make_validation_stats(self, tlm, model_spec, outdir, run_start):
+        """
+        Compute the validation statistics by running the thermal model
+        from a time in the past forward to the present and comparing it
+        to real telemetry, and write the quantile table, without making
+        any plots.
 
-        if 'earthheat__fptemp' in model.comp:
+        Parameters
+        ----------
+        tlm : NumPy record array
+            NumPy record array of telemetry
+        model_spec : string
+            The path to the thermal model specification.
+        outdir : string
+            The directory to write outputs to.
+        run_start : string
+            The starting date/time of the run.
 
-            fig = plt.figure(10 + fig_id, figsize=(12, 6))
+        Returns
+        -------
+        A list of dictionaries with the MSID and the quantiles of the
+        residuals, in the same form as the list returned by
+        :meth:`make_validation_plots`, but without the plots.
+        """
+        valid = self.calc_validation(tlm, model_spec)
+        self._write_validation_data(outdir, run_start, valid)
+        return [stats.as_dict() for stats in valid["stats"].values()]
+
+    def make_validation_plots(self, tlm, model_spec, outdir, run_start):
+        """
+        Make validation output plots by running the thermal model from a
+        time in the past forward to the present and compare it to real
+        telemetry
+
+        Parameters
+        ----------
+        tlm : NumPy record array
+            NumPy record array of telemetry
+        model_spec : string
+            The path to the thermal model specification.
+        outdir : string
+            The directory to write outputs to.
+        run_start : string
+            The starting date/time of the run.
+        """
+        from Ska.Matplotlib import cxctime2plotdate, plot_cxctime
+        from kadi import events
+        plt = get_pyplot()
+
+        # find perigee passages
+        rzs = events.rad_zones.filter(tlm['date'][0], tlm['date'][-1])
+
+        valid = self.calc_validation(tlm, model_spec)
+        model = valid["model"]
+        pred = valid["pred"]
+        tlm = valid["tlm"]
+        good_mask = valid["good_mask"]
+
+        # Set up labels for validation plots
+        labels = {self.msid: 'Temperature ($^\circ$C)',
+                  'pitch': 'Pitch (deg)',
+                  'tscpos': 'SIM-Z (steps/1000)',
+                  'roll': 'Off-Nominal Roll (deg)'}
+
+        scales = {'tscpos': 1000.}
+
+        plots = []
+        mylog.info('Making %s model validation plots' % self.name.upper())
+        xmin, xmax = cxctime2plotdate(model.times)[[0, -1]]
+        fig_id = 0
+        for msid in pred.keys():
+            with self.timer.stage("plot_%s" % msid):
+                plot = valid["stats"][msid].as_dict()
+                fig = plt.figure(10 + fig_id, figsize=(12, 6))
+                fig.clf()
+                scale = scales.get(msid, 1.0)
+                ticklocs, fig, ax = plot_cxctime(model.times, pred[msid] / scale, label='Model',
+                                                 fig=fig, ls='-', lw=4, color=thermal_red)
+                ticklocs, fig, ax = plot_cxctime(model.times, tlm[msid] / scale, label='Data',
+                                                 fig=fig, ls='-', lw=2, color=thermal_blue)
+                if np.any(~good_mask):
+                    ticklocs, fig, ax = plot_cxctime(model.times[~good_mask],
+                                                     tlm[msid][~good_mask] / scale,
+                                                     fig=fig, fmt='.c')
+                ax.set_title(msid.upper() + ' validation', loc='left', pad=10)
+                ax.set_xlabel("Date")
+                ax.set_ylabel(labels[msid])
+                ax.grid()
+                # add lines for perigee passages
+                for rz in rzs:
+                    ptimes = cxctime2plotdate([rz.tstart, rz.tstop])
+                    for ptime in ptimes:
+                        ax.axvline(ptime, ls='--', color='C2',
+                                   linewidth=2, zorder=-10)
+                # Add horizontal lines for the planning and caution limits
+                # or the limits for the focal plane model. Make sure we can
+                # see all of the limits.
+                if self.msid == msid:
+                    ymin, ymax = ax.get_ylim()
+                    if msid == "fptemp":
+                        ax.axhline(self.cold_ecs_limit, linestyle='--',
+                                   color='dodgerblue', label='Cold ECS',
+                                   zorder=-8, linewidth=2)
+                        ax.axhline(self.acis_i_limit, linestyle='--',
+                                   color='purple', zorder=-8, label='ACIS-I',
+                                   linewidth=2)
+                        ax.axhline(self.acis_s_limit, linestyle='--', 
+                                   color='blue', zorder=-8, label='ACIS-S',
+                                   linewidth=2)
+                        ax.axhline(self.acis_hot_limit, linestyle='--', 
+                                   color='red', zorder=-8, label='Hot ACIS',
+                                   linewidth=2)
+                        ymax = max(self.acis_hot_limit+1, ymax)
+                    else:
+                        ax.axhline(self.yellow_hi_limit, linestyle='-', color='gold',
+                                   zorder=-8, linewidth=2, label='Yellow')
+                        ax.axhline(self.plan_hi_limit, linestyle='-', color='C2',
+                                   zorder=-8, linewidth=2, label='Planning')
+                        ymax = max(self.yellow_hi_limit+1, ymax)
+                        if self.flag_cold_viols:
+                            ax.axhline(self.yellow_lo_limit, linestyle='-', color='gold', linewidth=2)
+                            ax.axhline(self.plan_lo_limit, linestyle='-', color='C2', linewidth=2)
+                            ymin = min(self.yellow_lo_limit-1, ymin)
+                    ax.set_ylim(ymin, ymax)
+                ax.set_xlim(xmin, xmax)
+
+                plot['lines'] = {"fig": fig,
+                                 "ax": ax,
+                                 "filename": msid + '_valid.png'}
+
+                # We make two histogram plots for each validation,
+                # one with linear and another with log scaling, from
+                # the same histogram counts
+                fig, axes = plt.subplots(ncols=2, num=20+fig_id, figsize=(12.0, 3.5))
+                for i, histscale in enumerate(('log', 'lin')):
+                    ax = axes[i]
+                    valid["stats"][msid].plot_hist(ax, scale=scale,
+                                                   log=(histscale == 'log'),
+                                                   color=thermal_blue,
+                                                   color2=thermal_red)
+                    ax.set_title(msid.upper() + ' residuals: data - model')
+                    ax.set_xlabel(labels[msid])
+                fig.subplots_adjust(bottom=0.18, left=0.15, wspace=0.6)
+                plot['hist'] = {'fig': fig,
+                                "ax": ax,
+                                'filename': '%s_valid_hist.png' % msid}
+                fig_id += 1
+                plots.append(plot)
+
+        with self.timer.stage("plot_ccd_count"):
+            fig = plt.figure(10+fig_id, figsize=(12, 6))
             fig.clf()
-            ticklocs, fig, ax = plot_cxctime(model.times, model.comp['earthheat__fptemp'].dvals,
+            ticklocs, fig, ax = plot_cxctime(model.times, model.comp['ccd_count'].dvals,
                                              fig=fig, ls='-', lw=2, color=thermal_blue)
-            ax.set_title("Earth Solid Angle in Rad FOV")
+            ticklocs, fig, ax = plot_cxctime(model.times, model.comp['fep_count'].dvals,
+                                             fig=fig, ls='--', lw=2, color=thermal_blue)
+            ax.set_ylim(0, 6.5)
+            ax.set_title("ACIS CCD/FEPs")
             ax.set_xlabel("Date")
-            ax.set_ylabel("Earth Solid Angle (sr)")
-            ax.set_yscale("log")
+            ax.set_ylabel("CCD/FEP Count")
             ax.grid()
             ax.set_xlim(xmin, xmax)
-            ax.set_ylim(1.0e-3, 1.0)
+            ax.lines[0].set_label('CCDs')
+            ax.lines[1].set_label('FEPs')
             # add lines for perigee passages
             for rz in rzs:
                 ptimes = cxctime2plotdate([rz.tstart, rz.tstop])
                 for ptime in ptimes:
                     ax.axvline(ptime, ls='--', color='C2',
                                linewidth=2, zorder=-10)
-
-            plot = {"msid": 'earthheat__fptemp',
+            ax.legend(fancybox=True, framealpha=0.5, loc=2)
+            plot = {"msid": "ccd_count",
                     "lines": {"fig": fig,
                               "ax": ax,
-                              "filename": 'earth_solid_angle_valid.png'}
+                              "filename": 'ccd_count_valid.png'}
                     }
 
             plots.append(plot)
 
             fig_id += 1
 
+        if 'earthheat__fptemp' in model.comp:
+
+            with self.timer.stage("plot_earthheat__fptemp"):
+                fig = plt.figure(10 + fig_id, figsize=(12, 6))
+                fig.clf()
+                ticklocs, fig, ax = plot_cxctime(model.times, model.comp['earthheat__fptemp'].dvals,
+                                                 fig=fig, ls='-', lw=2, color=thermal_blue)
+                ax.set_title("Earth Solid Angle in Rad FOV")
+                ax.set_xlabel("Date")
+                ax.set_ylabel("Earth Solid Angle (sr)")
+                ax.set_yscale("log")
+                ax.grid()
+                ax.set_xlim(xmin, xmax)
+                ax.set_ylim(1.0e-3, 1.0)
+                # add lines for perigee passages
+                for rz in rzs:
+                    ptimes = cxctime2plotdate([rz.tstart, rz.tstop])
+                    for ptime in ptimes:
+                        ax.axvline(ptime, ls='--', color='C2',
+                                   linewidth=2, zorder=-10)
+
+                plot = {"msid": 'earthheat__fptemp',
+                        "lines": {"fig": fig,
+                                  "ax": ax,
+                                  "filename": 'earth_solid_angle_valid.png'}
+                        }
+
+                plots.append(plot)
+
+                fig_id += 1
+
         # This call allows the specific check tool
         # to customize plots after the fact
         self.custom_validation_plots(plots)
@@ -1044,30 +1659,16 @@ class ACISThermalCheck(object):
 
         # Now write all of the plots after possible
         # customizations have been made
+        figures = []
         for plot in plots:
             for key in plot:
                 if key in ['lines', 'hist']:
                     outfile = os.path.join(outdir,
                                            plot[key]['filename'])
-                    mylog.info('Writing plot file %s' % outfile)
-                    plot[key]['fig'].savefig(outfile)
+                    figures.append((plot[key]['fig'], outfile))
+        save_figures(figures, nprocs=self.plot_nprocs, timer=self.timer)
 
-        # Write quantile tables to a CSV file
-        filename = os.path.join(outdir, 'validation_quant.csv')
-        mylog.info('Writing quantile table %s' % filename)
-        f = open(filename, 'w')
-        f.write(quant_table)
-        f.close()
-
-        # If run_start is specified this is likely for regression testing
-        # or other debugging.  In this case write out the full predicted and
-        # telemetered dataset as a pickle.
-        if run_start:
-            filename = os.path.join(outdir, 'validation_data.pkl')
-            mylog.info('Writing validation data %s' % filename)
-            f = open(filename, 'wb')
-            pickle.dump({'pred': pred, 'tlm': tlm}, f, protocol=2)
-            f.close()
+        self._write_validation_data(outdir, run_start, valid)
 
         return plots
 
@@ -1084,8 +1685,9 @@ class ACISThermalCheck(object):
         """
         pass
 
-    def rst_to_html(self, outdir, proc):
-        """Run rst2html.py to render index.rst as HTML]
+    def rst_to_html(self, outdir, proc, rst=None):
+        """
+        Render the reST report as HTML in "index.html" using docutils.
 
         Parameters
         ----------
@@ -1094,35 +1696,49 @@ class ACISThermalCheck(object):
             written to.
         proc : dict
             A dictionary of general information used in the output
+        rst : string, optional
+            The reST text to render. Default: None, which renders
+            the file "index.rst" in *outdir*.
         """
-        # First copy CSS files to outdir
-        import Ska.Shell
+        import docutils.core
         import docutils.writers.html4css1
+
+        # First copy CSS files to outdir
         dirname = os.path.dirname(docutils.writers.html4css1.__file__)
         shutil.copy2(os.path.join(dirname, 'html4css1.css'), outdir)
 
         shutil.copy2(os.path.join(TASK_DATA, 'acis_thermal_check', 'templates',
                                   'acis_thermal_check.css'), outdir)
 
-        # Spawn a shell and call rst2html to generate HTML from the reST.
-        spawn = Ska.Shell.Spawn(stdout=None)
-        infile = os.path.join(outdir, 'index.rst')
+        # Use the same settings as rst2html.py would have. The "colwidths-auto"
+        # table style leaves out the <colgroup> field that docutils otherwise
+        # inserts, which prevents HTML table auto-sizing. This does not apply
+        # to tables with explicit column widths, so the template must not
+        # give any (e.g. with the :widths: option of csv-table).
+        settings = {'stylesheet_path': os.path.join(outdir, 'acis_thermal_check.css'),
+                    'table_style': 'colwidths-auto'}
         outfile = os.path.join(outdir, 'index.html')
-        status = spawn.run(['rst2html.py',
-                            '--stylesheet-path={}'
-                            .format(os.path.join(outdir, 'acis_thermal_check.css')),
-                            infile, outfile])
-        if status != 0:
-            proc['errors'].append('rst2html.py failed with status {}: see run log'
-                                  .format(status))
-            mylog.error('rst2html.py failed')
-            mylog.error(''.join(spawn.outlines) + '\n')
-
-        # Remove the stupid <colgroup> field that docbook inserts.  This
-        # <colgroup> prevents HTML table auto-sizing.
-        del_colgroup = re.compile(r'<colgroup>.*?</colgroup>', re.DOTALL)
-        outtext = del_colgroup.sub('', open(outfile).read())
-        open(outfile, 'w').write(outtext)
+        try:
+            if rst is None:
+                docutils.core.publish_file(source_path=os.path.join(outdir, 'index.rst'),
+                                           destination_path=outfile,
+                                           writer_name='html4css1',
+                                           settings_overrides=settings)
+            else:
+                html = docutils.core.publish_string(rst, writer_name='html4css1',
+                                                    settings_overrides=settings)
+                with open(outfile, "wb") as fout:
+                    fout.write(html)
+        except Exception as e:
+            proc['errors'].append('Rendering the HTML failed with the error '
+                                  '"{}": see run log'.format(e))
+            mylog.error('Rendering the HTML failed')
+            mylog.error('%s\n' % e)
+
+    def _render_index(self, context):
+        # Fill out the reST template with the context using jinja2
+        template = get_template('index_template.rst')
+        return template.render(**context)
 
     def write_index_rst(self, outdir, context):
         """
@@ -1136,19 +1752,28 @@ class ACISThermalCheck(object):
         context : dict
             Dictionary of items which will be written to the ReST file.
         """
-        import jinja2
-        template_path = os.path.join(TASK_DATA, 'acis_thermal_check',
-                                     'templates', 'index_template.rst')
         outfile = os.path.join(outdir, 'index.rst')
         mylog.info('Writing report file %s' % outfile)
-        # Open up the reST template and send the context to it using jinja2
-        with open(template_path) as fin:
-            index_template = fin.read()
-            index_template = re.sub(r' %}\n', ' %}', index_template)
-            template = jinja2.Template(index_template)
         # Render the template and write it to a file
         with open(outfile, "w") as fout:
-            fout.write(template.render(**context))
+            fout.write(self._render_index(context))
+
+    def write_index_html(self, outdir, context, proc):
+        """
+        Make the HTML report in outdir directly from the context,
+        without writing the intermediate ReST file.
+
+        Parameters
+        ----------
+        outdir : string
+            Path to the location where the outputs will be written.
+        context : dict
+            Dictionary of items which will be written to the report.
+        proc : dict
+            A dictionary of general information used in the output
+        """
+        mylog.info('Writing report file %s' % os.path.join(outdir, 'index.html'))
+        self.rst_to_html(outdir, proc, rst=self._render_index(context))
 
     def _setup_proc_and_logger(self, args):
         """
@@ -1216,6 +1841,7 @@ class ACISThermalCheck(object):
         is_weekly_load : boolean
             Whether or not this is a weekly load.
         """
+        from cxotime import CxoTime
         tnow = CxoTime(run_start).secs
         # Get tstart, tstop, commands from state builder
         if is_weekly_load:
@@ -1244,6 +1870,9 @@ class ACISThermalCheck(object):
         days: integer, optional
             Length of telemetry request before ``tstart`` in days. Default: 14
         """
+        import Ska.Numpy
+        from cxotime import CxoTime
+
         # Get temperature and other telemetry for 3 weeks prior to min(tstart, NOW)
         the_msid = self.msid
         if self.other_map is not None:
@@ -1267,14 +1896,24 @@ class ACISThermalCheck(object):
         start = CxoTime(tstart - days * 86400).date
         stop = CxoTime(tstart).date
         mylog.info('Fetching telemetry between %s and %s' % (start, stop))
-        msidset = fetch.MSIDset(telem_msids, start, stop, stat='5min')
-        start = max(x.times[0] for x in msidset.values())
-        stop = min(x.times[-1] for x in msidset.values())
+        # Telemetry already fetched for another model in the same
+        # context is reused
+        telem = self._get_context().fetch_telem(telem_msids,
+                                                CxoTime(start).secs,
+                                                CxoTime(stop).secs)
+        start = max(x[0][0] for x in telem.values())
+        stop = min(x[0][-1] for x in telem.values())
         # Interpolate the MSIDs to a common set of times, 5 mins apart (328 s)
-        msidset.interpolate(328.0, start, stop + 1)
+        # using the nearest value. This is the same grid which
+        # msidset.interpolate(328.0, start, stop + 1) makes, which clips
+        # the requested range to the range of the data of every MSID.
+        dt = 328.0
+        tstart_grid = max(start, max(x[0][0] for x in telem.values()))
+        tstop_grid = min(stop + 1, min(x[0][-1] for x in telem.values()))
+        times = np.arange((tstop_grid - tstart_grid) // dt + 1) * dt + tstart_grid
 
         # Finished when we found at least 4 good records (20 mins)
-        if len(msidset.times) < 4:
+        if len(times) < 4:
             raise ValueError('Found no telemetry within %d days of %s'
                              % (days, str(tstart)))
 
@@ -1283,8 +1922,13 @@ class ACISThermalCheck(object):
         # In some cases we replace the MSID name with something
         # more human-readable.
         outnames = ['date'] + [name_map.get(x, x) for x in telem_msids]
-        vals = {name_map.get(x, x): msidset[x].vals for x in telem_msids}
-        vals['date'] = msidset.times
+        vals = {}
+        for msid in telem_msids:
+            msid_times, msid_vals = telem[msid]
+            idxs = Ska.Numpy.interpolate(np.arange(len(msid_times)), msid_times,
+                                         times, method='nearest', sorted=True)
+            vals[name_map.get(msid, msid)] = msid_vals[idxs]
+        vals['date'] = times
         out = Ska.Numpy.structured_array(vals, colnames=outnames)
 
         # tscpos needs to be converted to steps and must be in the right direction
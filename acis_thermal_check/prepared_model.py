@@ -0,0 +1,142 @@
+import json
+import numpy as np
+from acis_thermal_check.utils import calc_pitch_roll
+
+
+class PreparedModel(object):
+    """
+    The inputs of a thermal model run for an ACISThermalCheck, which
+    are kept so that the model can be run again with different states,
+    a different initial state, or a different time window, while only
+    the inputs which depend on what has changed are computed again.
+    The ephemeris is only obtained again if the time window changes,
+    the pitch and roll are only computed again if the states or the
+    time window change, and the detector housing heater history is
+    only read once.
+
+    Parameters
+    ----------
+    check : ACISThermalCheck object
+        The thermal model check which sets up the model.
+    model_spec : string or dict
+        The path to the JSON file containing the model specification,
+        or the model specification itself.
+    states : NumPy record array
+        Commanded states
+    tstart : float
+        The start time of the model run.
+    tstop : float
+        The end time of the model run.
+    state0 : dict, optional
+        This is used to set the initial temperature. It's a dictionary
+        indexed by MSID name so that more than one can be input if
+        necessary.
+    """
+    def __init__(self, check, model_spec, states, tstart, tstop, state0=None):
+        if not isinstance(model_spec, dict):
+            with open(model_spec, "r") as f:
+                model_spec = json.load(f)
+        self.check = check
+        self.model_spec = model_spec
+        self.states = states
+        self.state0 = state0
+        self.tstart = tstart
+        self.tstop = tstop
+        self.times = None
+        self.ephem = None
+        self.pitch = None
+        self.roll = None
+        self.dh_heater = None
+
+    def update(self, states=None, state0=None, tstart=None, tstop=None):
+        """
+        Change some of the inputs of the model, so that the inputs
+        which depend on them are computed again on the next run.
+
+        Parameters
+        ----------
+        states : NumPy record array, optional
+            New commanded states.
+        state0 : dict, optional
+            A new initial state.
+        tstart : float, optional
+            A new start time of the model run.
+        tstop : float, optional
+            A new end time of the model run.
+        """
+        if tstart is not None and tstart != self.tstart:
+            self.tstart = tstart
+            self.times = None
+        if tstop is not None and tstop != self.tstop:
+            self.tstop = tstop
+            self.times = None
+        if states is not None:
+            self.states = states
+            self.pitch = self.roll = None
+        if state0 is not None:
+            self.state0 = state0
+
+    def _make_model(self, model_spec=None):
+        # Create the model and compute any inputs which are
+        # missing or out of date
+        import xija
+        if model_spec is None:
+            model_spec = self.model_spec
+        timer = self.check.timer
+        model = xija.ThermalModel(self.check.name, start=self.tstart,
+                                  stop=self.tstop, model_spec=model_spec)
+        if self.times is None or not np.array_equal(self.times, model.times):
+            self.times = model.times
+            with timer.stage("ephemeris"):
+                self.ephem = self.check.get_ephemeris(self.tstart, self.tstop,
+                                                      model.times)
+            self.pitch = self.roll = None
+        if self.pitch is None:
+            with timer.stage("pitch_roll"):
+                self.pitch, self.roll = calc_pitch_roll(model.times, self.ephem,
+                                                        self.states)
+        if self.dh_heater is None:
+            self.dh_heater = self.check.get_dh_heater(self.state0)
+        return model
+
+    def prepare(self):
+        """
+        Compute all of the inputs of the model without running it.
+        """
+        self._make_model()
+
+    def run(self, states=None, state0=None, tstart=None, tstop=None,
+            model_spec=None):
+        """
+        Set up the model with the prepared inputs and run it. Any
+        inputs which are given are changed as in :meth:`update`
+        before the model is run.
+
+        Parameters
+        ----------
+        states : NumPy record array, optional
+            New commanded states.
+        state0 : dict, optional
+            A new initial state.
+        tstart : float, optional
+            A new start time of the model run.
+        tstop : float, optional
+            A new end time of the model run.
+        model_spec : dict, optional
+            A model specification to use for this run only, e.g. with
+            different parameter values. It must have the same time
+            step as the prepared model specification.
+
+        Returns
+        -------
+        The xija ThermalModel, which has been calculated.
+        """
+        self.update(states=states, state0=state0, tstart=tstart, tstop=tstop)
+        model = self._make_model(model_spec=model_spec)
+        self.check._setup_model(model, self.states, self.state0, self.ephem,
+                                self.pitch, self.roll, dh_heater=self.dh_heater)
+        with self.check.timer.stage("model_make"):
+            model.make()
+        with self.check.timer.stage("model_calc"):
+            model.calc()
+        return model
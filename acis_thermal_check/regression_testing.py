@@ -3,7 +3,6 @@ from numpy.testing import assert_array_equal, \
     assert_allclose
 import shutil
 import tempfile
-import pickle
 from pathlib import Path
 
 months = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN",
@@ -74,11 +73,17 @@ class TestArgs(object):
     nlet_file : string, optional
         The path to an alternative NLET file to be used. Default: None,
         which is to use the default one. 
+    cache_dir : string, optional
+        The path to the on-disk cache of telemetry and other inputs.
+        Default: None, which is to not cache anything to disk.
+    data_only : boolean, optional
+        If True, do not make plots or the web page, and only write the
+        results as data files. Default: False
     """
     def __init__(self, name, outdir, model_path, run_start=None,
                  load_week=None, days=21.0, T_init=None, interrupt=False,
                  state_builder='acis', verbose=0, model_spec=None,
-                 nlet_file=None):
+                 nlet_file=None, cache_dir=None, data_only=False):
         from datetime import datetime
         self.load_week = load_week
         if run_start is None:
@@ -110,6 +115,17 @@ class TestArgs(object):
             model_spec = os.path.join(model_path, "%s_model_spec.json" % name)
         self.model_spec = model_spec
         self.version = None
+        self.cache_dir = cache_dir
+        self.plot_nprocs = 1
+        self.data_only = data_only
+        self.ensemble_size = 0
+        self.ensemble_T_sigma = 1.0
+        self.ensemble_par_sigma = 0.01
+        self.ensemble_seed = None
+        self.ensemble_nprocs = 1
+        self.profile = False
+        self.valid_stats_only = False
+        self.write_npz = True
         if name == "acisfp":
             self.fps_nopref = os.path.join(model_path, "FPS_NoPref.txt")
 
@@ -238,7 +254,7 @@ class RegressionTester(object):
             if self.name == "acisfp":
                 filenames.append("earth_solid_angles.dat")
         elif test_name == "validation":
-            filenames = ["validation_data.pkl"]
+            filenames = ["validation_data.npz"]
         else:
             raise RuntimeError("Invalid test specification! "
                                "Test name = %s." % test_name)
@@ -246,6 +262,12 @@ class RegressionTester(object):
             compare_test = getattr(self, "compare_"+test_name)
             compare_test(load_week, out_dir, filenames)
         else:
+            # Also store the binary versions of the prediction
+            # files, if they were written
+            for fn in list(filenames):
+                npz_fn = os.path.splitext(fn)[0] + ".npz"
+                if fn.endswith(".dat") and os.path.exists(os.path.join(out_dir, npz_fn)):
+                    filenames.append(npz_fn)
             answer_dir = self._set_answer_dir(load_week)
             self.copy_new_files(out_dir, answer_dir, filenames)
 
@@ -262,15 +284,20 @@ class RegressionTester(object):
             The path to the output directory.
         filenames : list of strings
             The list of files which will be used in the comparison.
-            Currently only "validation_data.pkl".
+            Currently only "validation_data.npz". If the gold standard
+            answers are only stored as "validation_data.pkl", as written
+            by older versions, that is used instead.
         """
-        # First load the answers from the pickle files, both gold standard
-        # and current
+        from acis_thermal_check.validation import read_validation_data
+        # First load the answers, both gold standard and current. The
+        # columns are memory-mapped and only read when compared.
         new_answer_file = os.path.join(out_dir, filenames[0])
-        new_results = pickle.load(open(new_answer_file, "rb"))
+        new_results = read_validation_data(new_answer_file)
         old_answer_file = os.path.join(self.model_path, "tests/answers", load_week,
                                        filenames[0])
-        old_results = pickle.load(open(old_answer_file, "rb"))
+        if not os.path.exists(old_answer_file):
+            old_answer_file = os.path.splitext(old_answer_file)[0] + ".pkl"
+        old_results = read_validation_data(old_answer_file)
         # Compare predictions
         new_pred = new_results["pred"]
         old_pred = old_results["pred"]
@@ -287,12 +314,12 @@ class RegressionTester(object):
         # Compare telemetry
         new_tlm = new_results['tlm']
         old_tlm = old_results['tlm']
-        tlm_keys = set(new_tlm.dtype.names) | set(old_tlm.dtype.names)
+        tlm_keys = set(new_tlm.keys()) | set(old_tlm.keys())
         for k in tlm_keys:
-            if k not in new_tlm.dtype.names:
+            if k not in new_tlm:
                 print("WARNING in tlm: '%s' in old answer but not new. Answers should be updated." % k)
                 continue
-            if k not in old_tlm.dtype.names:
+            if k not in old_tlm:
                 print("WARNING in tlm: '%s' in new answer but not old. Answers should be updated." % k)
                 continue
             exception_catcher(assert_array_equal, new_tlm[k], old_tlm[k],
@@ -312,18 +339,33 @@ class RegressionTester(object):
             The path to the output directory.
         filenames : list of strings
             The list of files which will be used in the comparison.
+            If binary versions of them (e.g. "temperatures.npz") exist
+            both for this run and in the gold standard answers, those
+            are compared instead.
         """
         from astropy.io import ascii
+        import numpy as np
         for fn in filenames:
             new_fn = os.path.join(out_dir, fn)
             old_fn = os.path.join(self.model_path, "tests/answers", load_week, fn)
-            new_data = ascii.read(new_fn).as_array()
-            old_data = ascii.read(old_fn).as_array()
-            # Compare test run data to gold standard. Since we're loading from
-            # ASCII text files here, floating-point comparisons will be different
-            # at machine precision, others will be exact.
-            for k, dt in new_data.dtype.descr:
-                if 'f' in dt:
+            new_npz = os.path.splitext(new_fn)[0] + ".npz"
+            old_npz = os.path.splitext(old_fn)[0] + ".npz"
+            if os.path.exists(new_npz) and os.path.exists(old_npz):
+                with np.load(new_npz) as f:
+                    new_data = {k: f[k] for k in f.files}
+                with np.load(old_npz) as f:
+                    old_data = {k: f[k] for k in f.files}
+            else:
+                new_data = ascii.read(new_fn).as_array()
+                old_data = ascii.read(old_fn).as_array()
+                new_data = {k: new_data[k] for k in new_data.dtype.names}
+                old_data = {k: old_data[k] for k in old_data.dtype.names}
+            # Compare test run data to gold standard. Since the floating-point
+            # values may have been rounded when written to ASCII text files,
+            # floating-point comparisons will be different at machine precision,
+            # others will be exact.
+            for k in new_data:
+                if new_data[k].dtype.kind == 'f':
                     exception_catcher(assert_allclose, new_data[k], old_data[k],
                                       "Prediction arrays for %s" % k, rtol=1.0e-5)
                 else:
@@ -0,0 +1,250 @@
+import os
+import sys
+from acis_thermal_check.utils import mylog, make_state_builder, \
+    get_options
+from acis_thermal_check.cache import get_cache_dir, TelemetryCache, \
+    EphemerisStore
+
+
+class RunContext(object):
+    """
+    A RunContext holds the inputs which are shared between all of
+    the thermal models which are run for the same load, so that the
+    telemetry, ephemeris, and commanded states only have to be
+    obtained once, no matter how many models use them. A single
+    RunContext may be passed to the ``run`` method of any number of
+    ACISThermalCheck objects.
+
+    Parameters
+    ----------
+    args : ArgumentParser arguments, optional
+        The command-line options object, which is used to set up the
+        state builder. If not supplied, no state builder will be
+        created unless one is passed in.
+    state_builder : StateBuilder object, optional
+        The state builder to use for the prediction and validation
+        states. Default: None, which creates one from *args*.
+    """
+    def __init__(self, args=None, state_builder=None):
+        if state_builder is None and args is not None:
+            state_builder = make_state_builder(args.state_builder, args)
+        self.state_builder = state_builder
+        self._telem = {}
+        self._ephem_store = None
+        self._validation_states = {}
+        self._prediction_states = {}
+
+    def fetch_telem(self, msids, tstart, tstop):
+        """
+        Get the 5-minute telemetry for a list of MSIDs between two
+        times. MSIDs which have already been fetched for the same
+        times are not fetched again.
+
+        Parameters
+        ----------
+        msids : list of strings
+            The MSIDs to fetch.
+        tstart : float
+            The start time in seconds from the beginning of the mission.
+        tstop : float
+            The stop time in seconds from the beginning of the mission.
+
+        Returns
+        -------
+        A dictionary of 2-tuples of NumPy arrays (times and values),
+        keyed by MSID.
+        """
+        to_fetch = [msid for msid in msids
+                    if (msid, tstart, tstop) not in self._telem]
+        if len(to_fetch) > 0:
+            cache_dir = get_cache_dir("telem")
+            if cache_dir is None:
+                import Ska.engarchive.fetch_sci as fetch
+                msidset = fetch.MSIDset(to_fetch, tstart, tstop, stat='5min')
+                telem = {msid: (msidset[msid].times, msidset[msid].vals)
+                         for msid in to_fetch}
+            else:
+                # Only fetch the telemetry which is not already in the
+                # on-disk cache
+                telem_cache = TelemetryCache(cache_dir)
+                telem = telem_cache.fetch(to_fetch, tstart, tstop)
+            for msid in to_fetch:
+                self._telem[msid, tstart, tstop] = telem[msid]
+        return {msid: self._telem[msid, tstart, tstop] for msid in msids}
+
+    def fetch_ephemeris(self, tstart, tstop):
+        """
+        Get the orbit and solar ephemeris between two times. The
+        ephemeris is kept in an :class:`EphemerisStore`, so that only
+        the days which have not been obtained already (in this context,
+        or in the on-disk cache if it is turned on) are fetched.
+
+        Parameters
+        ----------
+        tstart : float
+            The start time in seconds from the beginning of the mission.
+        tstop : float
+            The stop time in seconds from the beginning of the mission.
+
+        Returns
+        -------
+        A dictionary of 2-tuples of NumPy arrays (times and values),
+        keyed by MSID.
+        """
+        if self._ephem_store is None:
+            self._ephem_store = EphemerisStore(get_cache_dir("ephem"))
+        return self._ephem_store.fetch(tstart, tstop)
+
+    def get_validation_states(self, datestart, datestop):
+        """
+        Get states for validation of the thermal model.
+
+        Parameters
+        ----------
+        datestart : string
+            The start date to grab states afterward.
+        datestop : string
+            The end date to grab states before.
+        """
+        key = (datestart, datestop)
+        if key not in self._validation_states:
+            self._validation_states[key] = \
+                self.state_builder.get_validation_states(datestart, datestop)
+        return self._validation_states[key].copy()
+
+    def get_prediction_states(self, tbegin):
+        """
+        Get the states used for the thermal prediction.
+
+        Parameters
+        ----------
+        tbegin : string
+            The starting date/time from which to obtain states for
+            prediction.
+        """
+        if tbegin not in self._prediction_states:
+            self._prediction_states[tbegin] = \
+                self.state_builder.get_prediction_states(tbegin)
+        states, state0 = self._prediction_states[tbegin]
+        # Return copies, since the models may modify them
+        return states.copy(), dict(state0)
+
+
+# The list of ACISThermalCheck subclasses which will be run
+# by run_checks, with the paths to their model packages
+registered_checks = []
+
+# The additional command-line options of the registered
+# ACISThermalCheck subclasses, keyed by class
+registered_opts = {}
+
+
+def register_check(check_class, model_path=None, opts=None):
+    """
+    Register an ACISThermalCheck subclass so that it is run
+    by :func:`run_checks`. The subclass must be able to be
+    created without any arguments.
+
+    Parameters
+    ----------
+    check_class : ACISThermalCheck subclass
+        The class of the thermal model check to register.
+    model_path : string, optional
+        The directory of the model package, where the model
+        specification file is located. Default: the directory
+        of the module where *check_class* is defined.
+    opts : list of (string, dict) tuples, optional
+        The additional command-line options of this model, as
+        passed to :func:`~acis_thermal_check.utils.get_options`
+        by the model's own script, e.g. the FPS no-preference file
+        of the ACIS FP model. Default: None, which uses the ``opts``
+        attribute of *check_class*, if it has one.
+    """
+    if model_path is None:
+        module = sys.modules[check_class.__module__]
+        model_path = os.path.abspath(os.path.dirname(module.__file__))
+    registered_checks.append((check_class, model_path))
+    if opts is not None:
+        registered_opts[check_class] = opts
+
+
+# The options which are never taken from the shared arguments,
+# since they are different for each model
+_model_specific_args = ("outdir", "model_spec")
+
+
+def setup_check_args(args, check, model_path, opts=None):
+    """
+    Make the arguments for running a single check among several
+    for the same load. The arguments start from the defaults of
+    this model's own options (as given by :func:`get_options` with
+    *opts*), so that options which only some models have are set
+    for the models which have them. The value of every option which
+    is also in the shared *args* is then taken from *args*, except
+    that the outputs go to a subdirectory of ``args.outdir`` with
+    the name of the model and the model specification file is taken
+    from the model package. Options in *args* which this model does
+    not have are left out.
+
+    Parameters
+    ----------
+    args : ArgumentParser arguments
+        The command-line options object shared by all of the checks.
+    check : ACISThermalCheck object
+        The thermal model check which will be run.
+    model_path : string
+        The directory of the model package.
+    opts : list of (string, dict) tuples, optional
+        The additional command-line options of this model.
+        Default: None, which uses the ``opts`` attribute of *check*,
+        if it has one.
+    """
+    if opts is None:
+        opts = getattr(check, "opts", None)
+    check_args = get_options(check.name, model_path, opts=opts, argv=[])
+    shared_args = vars(args)
+    for key in vars(check_args):
+        if key in shared_args and key not in _model_specific_args:
+            setattr(check_args, key, shared_args[key])
+    check_args.outdir = os.path.join(args.outdir, check.name)
+    check_args.model_spec = os.path.join(model_path,
+                                         "%s_model_spec.json" % check.name)
+    return check_args
+
+
+def run_checks(args, checks=None):
+    """
+    Run several thermal model checks on the same load, using
+    a single RunContext so that telemetry, ephemeris, and states
+    are only obtained once. The outputs of each check are written
+    to a subdirectory of ``args.outdir`` with the name of the model,
+    and each check uses the model specification file from its own
+    model package.
+
+    Parameters
+    ----------
+    args : ArgumentParser arguments
+        The command-line options object, which has the options
+        attached to it as attributes.
+    checks : list of (class, string) tuples, optional
+        The ACISThermalCheck subclasses to run and the paths to their
+        model packages. Default: all checks added with
+        :func:`register_check`.
+
+    Returns
+    -------
+    A dictionary of the results of each check, keyed by model name.
+    """
+    if checks is None:
+        checks = registered_checks
+    if not os.path.exists(args.outdir):
+        os.mkdir(args.outdir)
+    context = RunContext(args)
+    results = {}
+    for check_class, model_path in checks:
+        check = check_class()
+        check_args = setup_check_args(args, check, model_path,
+                                      opts=registered_opts.get(check_class))
+        mylog.info("Running the %s check" % check.name.upper())
+        results[check.name] = check.run(check_args, context=context)
+    return results
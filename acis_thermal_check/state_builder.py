@@ -6,6 +6,8 @@ import kadi.commands
 import kadi.commands.states as kadi_states
 import logging
 from Ska.File import get_globfiles
+from acis_thermal_check.cache import get_cache_dir, DiskCache, \
+    file_signature
 
 # Define state keys for states, corresponding to the legacy states in
 # Chandra.cmd_states.
@@ -242,7 +244,7 @@ class ACISStateBuilder(StateBuilder):
             # Get tstart, tstop, commands from backstop file in args.oflsdir
             # These are the REVIEW backstop commands. This returns a list of dict
             # representing the commands.
-            rev_bs_cmds, self.rev_bs_name = self.BSC.get_bs_cmds(self.backstop_file)
+            rev_bs_cmds, self.rev_bs_name = self._get_bs_cmds(self.backstop_file)
 
             # Store the Review Load backstop commands in the class attribute and
             # also capture the Review load time of first command (TOFC) and
@@ -255,6 +257,82 @@ class ACISStateBuilder(StateBuilder):
             # At the beginning, it will be the time of the last command in the Review Load
             self.BSC.end_event_time = rev_bs_cmds[-1]['time']
 
+    def _get_bs_cache(self):
+        """
+        Get the on-disk cache of parsed backstop commands and
+        assembled command histories, or None if there is no
+        cache directory.
+        """
+        cache_dir = get_cache_dir("backstop")
+        if cache_dir is None:
+            return None
+        return DiskCache(cache_dir)
+
+    def _get_bs_cmds(self, ofls_dir):
+        """
+        Get the commands from the backstop file in a load directory,
+        using the on-disk cache if the file has been parsed before.
+
+        Parameters
+        ----------
+        ofls_dir : string
+            Path to the backstop file or the directory containing it.
+        """
+        bs_cache = self._get_bs_cache()
+        if bs_cache is None:
+            return self.BSC.get_bs_cmds(ofls_dir)
+        key = ("bs_cmds", file_signature(ofls_dir))
+        cached = bs_cache.get(key)
+        if cached is None:
+            cached = self.BSC.get_bs_cmds(ofls_dir)
+            bs_cache.set(key, cached)
+        return cached
+
+    def _chain_key(self):
+        """
+        The key for the assembled command history in the on-disk
+        cache, which depends on the review load backstop and continuity
+        files, the contents of the NLET file, and whether this is an
+        interrupt load. The start time of the history and the
+        signatures of the continuity loads which were chained are
+        stored with it and checked by :meth:`_get_cached_chain`.
+        """
+        import hashlib
+        if self.nlet_file is not None and os.path.exists(self.nlet_file):
+            with open(self.nlet_file, "rb") as f:
+                nlet_md5 = hashlib.md5(f.read()).hexdigest()
+        else:
+            nlet_md5 = None
+        return ("bs_chain", file_signature(self.backstop_file), nlet_md5,
+                self.interrupt)
+
+    def _get_cached_chain(self, bs_cache, chain_key, tbegin):
+        """
+        Get the assembled command history from the on-disk cache, or
+        None if it is not there, if it starts after *tbegin*, or if any
+        of the continuity loads which were chained have changed since.
+
+        Parameters
+        ----------
+        bs_cache : DiskCache object
+            The on-disk cache.
+        chain_key : tuple
+            The key of the command history, from :meth:`_chain_key`.
+        tbegin : string
+            The starting date/time from which to obtain states for
+            prediction.
+        """
+        cached = bs_cache.get(chain_key)
+        if cached is None:
+            return None
+        chain_start, cont_sigs, chain_cmds = cached
+        if chain_start > CxoTime(tbegin).secs:
+            return None
+        for cont_path, sig in cont_sigs:
+            if not os.path.exists(cont_path) or file_signature(cont_path) != sig:
+                return None
+        return chain_cmds
+
     def get_prediction_states(self, tbegin):
         """
         Get the states used for the prediction.  This includes both the
@@ -290,12 +368,28 @@ class ACISStateBuilder(StateBuilder):
         # List of dict representing commands at this point
         bs_cmds = copy.copy(self.bs_cmds)
 
+        # If the commands for this load have been assembled before back
+        # to tbegin or earlier, start from the cached commands, so that
+        # the back-chaining below does not need to be done again.
+        bs_cache = self._get_bs_cache()
+        chain_cmds = None
+        if bs_cache is not None:
+            chain_key = self._chain_key()
+            chain_cmds = self._get_cached_chain(bs_cache, chain_key, tbegin)
+            if chain_cmds is not None:
+                self.logger.info('Using cached backstop command history')
+                bs_cmds = chain_cmds
+
         # Capture the start time of the review load
         bs_start_time = bs_cmds[0]['time']
 
         # Capture the path to the ofls directory
         present_ofls_dir = copy.copy(self.backstop_file)
 
+        # The continuity loads which are chained, whose signatures are
+        # stored in the cache with the commands
+        cont_load_paths = []
+
         # So long as the earliest command in bs_cmds is after the state0 time
         # (which is the same as tbegin), keep concatenating continuity commands
         # to bs_cmds based upon the type of load. Note that as you march back in
@@ -308,13 +402,14 @@ class ACISStateBuilder(StateBuilder):
 
             # Read the Continuity information of the present ofls directory
             cont_load_path, present_load_type, scs107_date = self.BSC.get_continuity_file_info(present_ofls_dir)
+            cont_load_paths.append(cont_load_path)
 
             #---------------------- NORMAL ----------------------------------------
             # If the load type is "normal" then grab the continuity command
             # set and concatenate those commands to the start of bs_cmds
             if present_load_type.upper() == 'NORMAL':
                 # Obtain the continuity load commands
-                cont_bs_cmds, cont_bs_name = self.BSC.get_bs_cmds(cont_load_path)
+                cont_bs_cmds, cont_bs_name = self._get_bs_cmds(cont_load_path)
 
                 # Combine the continuity commands with the bs_cmds. The result
                 # is stored in bs_cmds
@@ -330,7 +425,7 @@ class ACISStateBuilder(StateBuilder):
             # set and concatenate those commands to the start of bs_cmds
             elif present_load_type.upper() == 'TOO':
                 # Obtain the continuity load commands
-                cont_bs_cmds, cont_bs_name = self.BSC.get_bs_cmds(cont_load_path)
+                cont_bs_cmds, cont_bs_name = self._get_bs_cmds(cont_load_path)
 
                 # Combine the continuity commands with the bs_cmds
                 bs_cmds = self.BSC.CombineTOO(cont_bs_cmds, bs_cmds)
@@ -348,7 +443,7 @@ class ACISStateBuilder(StateBuilder):
             elif present_load_type.upper() == 'STOP':
 
                 # Obtain the continuity load commands
-                cont_bs_cmds, cont_bs_name = self.BSC.get_bs_cmds(cont_load_path)
+                cont_bs_cmds, cont_bs_name = self._get_bs_cmds(cont_load_path)
 
                 # CombineSTOP the continuity commands with the bs_cmds
                 bs_cmds = self.BSC.CombineSTOP(cont_bs_cmds, bs_cmds, scs107_date )
@@ -365,7 +460,7 @@ class ACISStateBuilder(StateBuilder):
             # and any LTCTI run
             elif present_load_type.upper() == 'SCS-107':
                 # Obtain the continuity load commands
-                cont_bs_cmds, cont_bs_name = self.BSC.get_bs_cmds(cont_load_path)
+                cont_bs_cmds, cont_bs_name = self._get_bs_cmds(cont_load_path)
                 # Store the continuity bs commands as a chunk in the chunk list
 
                 # Obtain the CONTINUITY load Vehicle-Only file
@@ -379,6 +474,12 @@ class ACISStateBuilder(StateBuilder):
                 # Now point the operative ofls directory to the Continuity directory
                 present_ofls_dir = cont_load_path
 
+        # Store the assembled commands in the cache for the next run
+        if bs_cache is not None and chain_cmds is None:
+            cont_sigs = [(cont_path, file_signature(cont_path))
+                         for cont_path in cont_load_paths]
+            bs_cache.set(chain_key, (bs_cmds[0]['time'], cont_sigs, bs_cmds))
+
         # Convert backstop commands from a list of dict to a CommandTable and
         # store in self.
         bs_cmds = kadi.commands.CommandTable(bs_cmds)
@@ -0,0 +1,102 @@
+import numpy as np
+from acis_thermal_check.cache import TelemetryCache, DiskCache
+
+dt = 328.0
+
+
+class FakeTelemetryCache(TelemetryCache):
+    """
+    A TelemetryCache which "fetches" a line on a regular grid of times
+    instead of going to the archive, and records each fetch.
+    """
+    def __init__(self, cache_dir, **kwargs):
+        super(FakeTelemetryCache, self).__init__(cache_dir, **kwargs)
+        self.fetches = []
+
+    def _fetch_msid(self, msid, tstart, tstop):
+        self.fetches.append((tstart, tstop))
+        times = np.arange(np.ceil(tstart / dt), np.floor(tstop / dt) + 1) * dt
+        return times, 2.0 * times
+
+
+def check_data(times, vals, tstart, tstop):
+    expected = np.arange(np.ceil(tstart / dt), np.floor(tstop / dt) + 1) * dt
+    np.testing.assert_array_equal(times, expected)
+    np.testing.assert_array_equal(vals, 2.0 * expected)
+
+
+def test_tail(tmp_path):
+    cache = FakeTelemetryCache(str(tmp_path))
+    cache.fetch_msid("1dpamzt", 1.0e8, 1.0e8 + 10 * 86400.0)
+    cache.fetches = []
+    tstop = 1.0e8 + 11 * 86400.0
+    times, vals = cache.fetch_msid("1dpamzt", 1.0e8 + 86400.0, tstop)
+    check_data(times, vals, 1.0e8 + 86400.0, tstop)
+    # Only the last day plus the overlap is fetched again
+    assert len(cache.fetches) == 1
+    tail_start, tail_stop = cache.fetches[0]
+    assert tail_stop == tstop
+    assert 1.0e8 + 10 * 86400.0 - cache.overlap - dt < tail_start
+    # A request inside the cached range fetches nothing
+    cache.fetches = []
+    times, vals = cache.fetch_msid("1dpamzt", 1.0e8, tstop - 3600.0)
+    check_data(times, vals, 1.0e8, tstop - 3600.0)
+    assert cache.fetches == []
+
+
+def test_head(tmp_path):
+    cache = FakeTelemetryCache(str(tmp_path))
+    cache.fetch_msid("1dpamzt", 1.0e8, 1.0e8 + 10 * 86400.0)
+    cache.fetches = []
+    tstart = 1.0e8 - 2 * 86400.0
+    times, vals = cache.fetch_msid("1dpamzt", tstart, 1.0e8 + 5 * 86400.0)
+    check_data(times, vals, tstart, 1.0e8 + 5 * 86400.0)
+    # Only the missing head is fetched, not the cached range
+    assert cache.fetches == [(tstart, 1.0e8)]
+    # The head was spliced on, so it is not fetched again
+    cache.fetches = []
+    times, vals = cache.fetch_msid("1dpamzt", tstart, 1.0e8 + 9 * 86400.0)
+    check_data(times, vals, tstart, 1.0e8 + 9 * 86400.0)
+    assert cache.fetches == []
+
+
+def test_gap(tmp_path):
+    cache = FakeTelemetryCache(str(tmp_path))
+    # e.g. a regression test run far in the past seeds the cache
+    cache.fetch_msid("1dpamzt", 1.0e8, 1.0e8 + 10 * 86400.0)
+    cache.fetches = []
+    tstart = 5.0e8
+    tstop = tstart + 10 * 86400.0
+    times, vals = cache.fetch_msid("1dpamzt", tstart, tstop)
+    check_data(times, vals, tstart, tstop)
+    # Only the requested range is fetched, not the gap
+    assert cache.fetches == [(tstart, tstop)]
+    # The new range replaces the old one in the cache
+    cache.fetches = []
+    times, vals = cache.fetch_msid("1dpamzt", tstart + 86400.0,
+                                   tstop - 3600.0)
+    check_data(times, vals, tstart + 86400.0, tstop - 3600.0)
+    assert cache.fetches == []
+    # A request well before the cached range fetches only that
+    # range and leaves the cache alone
+    times, vals = cache.fetch_msid("1dpamzt", 1.0e8, 1.0e8 + 86400.0)
+    check_data(times, vals, 1.0e8, 1.0e8 + 86400.0)
+    assert cache.fetches == [(1.0e8, 1.0e8 + 86400.0)]
+    cache.fetches = []
+    cache.fetch_msid("1dpamzt", tstart, tstop - 3600.0)
+    assert cache.fetches == []
+
+
+def test_disk_cache_unreadable(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.set(("bs_chain", 1), [1, 2, 3])
+    assert cache.get(("bs_chain", 1)) == [1, 2, 3]
+    # A truncated entry is a miss
+    cache_file = cache._cache_file(("bs_chain", 1))
+    with open(cache_file, "r+b") as f:
+        f.truncate(10)
+    assert cache.get(("bs_chain", 1)) is None
+    # So is an entry which is not a pickle at all
+    with open(cache_file, "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.get(("bs_chain", 1)) is None
@@ -0,0 +1,51 @@
+import json
+import os
+from argparse import Namespace
+from acis_thermal_check.driver import run_checks_parallel, _get_model_opts
+from acis_thermal_check.utils import get_options
+
+
+class GoodCheck(object):
+    name = "good"
+    opts = [("fps_nopref", {"default": "FPS_NoPref.txt"})]
+
+    def run(self, args):
+        assert args.fps_nopref == "FPS_NoPref.txt"
+        return {"any_viols": 0, "valid_viols": [], "errors": []}
+
+
+class BrokenCheck(object):
+    def __init__(self):
+        raise RuntimeError("cannot set up this model")
+
+
+def make_args(outdir):
+    return get_options("acis_thermal_check", os.getcwd(),
+                       argv=["--outdir", outdir])
+
+
+def test_one_check_fails(tmp_path):
+    outdir = str(tmp_path / "out")
+    checks = [(BrokenCheck, str(tmp_path)), (GoodCheck, str(tmp_path))]
+    summaries = run_checks_parallel(make_args(outdir), checks=checks,
+                                    nprocs=2)
+    assert summaries[0]["name"] == "BrokenCheck"
+    assert summaries[0]["status"] == "ERROR"
+    assert "cannot set up this model" in summaries[0]["errors"][0]
+    assert summaries[1]["name"] == "good"
+    assert summaries[1]["status"] == "OK"
+    with open(os.path.join(outdir, "summary.json")) as f:
+        assert json.load(f) == summaries
+
+
+def test_model_opts():
+    opts = _get_model_opts([GoodCheck, BrokenCheck],
+                           [("nprocs", {"type": int})])
+    assert [opt_name for opt_name, opt in opts] == ["nprocs", "fps_nopref"]
+    # Unless it is given, the option is left to the default of each model
+    args = get_options("acis_thermal_check", os.getcwd(), opts=opts, argv=[])
+    assert not hasattr(args, "fps_nopref")
+    args = get_options("acis_thermal_check", os.getcwd(), opts=opts,
+                       argv=["--fps_nopref", "other.txt"])
+    assert args.fps_nopref == "other.txt"
+    assert isinstance(args, Namespace)
@@ -0,0 +1,38 @@
+import pytest
+from acis_thermal_check.main import ACISThermalCheck
+
+docutils = pytest.importorskip("docutils")
+
+
+def test_index_html_has_no_colgroup(tmp_path):
+    # Render the report template with validation quantiles and
+    # validation violations, which are written as csv-tables
+    report_context = {
+        'bsdir': "/data/acis/LoadReviews/2021/JAN0421/ofls",
+        'viols': {'hi': {'name': 'Hot', 'type': 'Max', 'values': [
+            {'datestart': '2021:035:00:00:00.000',
+             'datestop': '2021:035:01:00:00.000',
+             'duration': 3.6, 'extemp': 38.5}]}},
+        'plots': {'default': {'filename': '1dpamzt.png'},
+                  'pow_sim': {'filename': 'pow_sim.png'},
+                  'roll': {'filename': 'roll.png'}},
+        'any_viols': False,
+        'valid_viols': [{'msid': '1DPAMZT', 'quant': '99', 'value': '3.00',
+                         'limit': 2.0}],
+        'proc': {'name': 'DPA', 'msid': '1DPAMZT', 'errors': [],
+                 'hist_limit': [20.0], 'op': ['>=']},
+        'pred_only': False,
+        'plots_validation': [{'msid': '1DPAMZT', 'quant01': '-1.00',
+                              'quant05': '-0.50', 'quant16': '-0.20',
+                              'quant50': '0.00', 'quant84': '0.20',
+                              'quant95': '0.50', 'quant99': '3.00',
+                              'lines': {'filename': '1dpamzt_valid.png'},
+                              'hist': {'filename': '1dpamzt_valid_hist.png'}}]}
+    check = ACISThermalCheck.__new__(ACISThermalCheck)
+    proc = {'errors': []}
+    check.write_index_html(str(tmp_path), report_context, proc)
+    assert proc['errors'] == []
+    with open(tmp_path / "index.html") as f:
+        html = f.read()
+    assert "<table" in html
+    assert "<colgroup" not in html
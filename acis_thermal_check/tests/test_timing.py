@@ -0,0 +1,28 @@
+import os
+import pytest
+from acis_thermal_check.timing import StageTimer
+
+
+def test_profile_new_outdir(tmp_path):
+    # e.g. a run with --profile and an outdir which does not exist yet
+    outdir = str(tmp_path / "out")
+    timer = StageTimer(profile_dir=outdir)
+    with timer.stage("run_context"):
+        with timer.stage("states"):
+            pass
+    assert os.path.exists(os.path.join(outdir, "profile_run_context.prof"))
+    # Only the top-level stages are profiled
+    assert not os.path.exists(os.path.join(outdir, "profile_states.prof"))
+    assert list(timer.timings) == ["run_context", "run_context.states"]
+    assert timer.timings["run_context"]["calls"] == 1
+
+
+def test_stage_stopped_on_error():
+    timer = StageTimer()
+    with pytest.raises(RuntimeError):
+        with timer.stage("plot_1dpamzt"):
+            raise RuntimeError("bad plot")
+    with timer.stage("plot_ccd_count"):
+        pass
+    # The failed stage was stopped, so the next one is not nested in it
+    assert list(timer.timings) == ["plot_1dpamzt", "plot_ccd_count"]
@@ -0,0 +1,194 @@
+import numpy as np
+import pytest
+from cxotime import CxoTime
+from acis_thermal_check.utils import find_violations, find_limit_violations, \
+    state_index, interval_mask
+
+times = 6.0e8 + 328.0*np.arange(200)
+
+
+def naive_violations(times, temp, load_start, limit, lim_type, mask=None):
+    # The violations found one interval at a time, as
+    # _make_prediction_viols used to find them
+    if mask is None:
+        mask = np.ones_like(temp, dtype='bool')
+    if lim_type == "min":
+        bad = (temp <= limit) & mask
+    else:
+        bad = (temp >= limit) & mask
+    op = getattr(np, lim_type)
+    bad = np.concatenate(([False], bad, [False]))
+    changes = np.flatnonzero(bad[1:] != bad[:-1]).reshape(-1, 2)
+    viols = []
+    for i0, i1 in changes:
+        t_after = times[min(i1, times.size - 1)]
+        in_load = times[i0] > load_start or times[i0] < load_start < t_after
+        tstart = times[i0] if times[i0] > load_start else load_start
+        tstop = times[i1 - 1]
+        duration = tstop - tstart
+        if in_load and duration >= 10.0:
+            viols.append((tstart, tstop, duration*1.0e-3, op(temp[i0:i1])))
+    return viols
+
+
+def check_violations(viols, expected):
+    assert len(viols) == len(expected)
+    for viol, (tstart, tstop, duration, extemp) in zip(viols, expected):
+        assert viol['tstart'] == tstart
+        assert viol['tstop'] == tstop
+        assert viol['duration'] == duration
+        assert viol['extemp'] == extemp
+        assert viol['datestart'] == CxoTime(tstart).date
+        assert viol['datestop'] == CxoTime(tstop).date
+
+
+def test_find_violations_random():
+    rng = np.random.default_rng(42)
+    temp = 30.0 + np.cumsum(rng.normal(size=times.size))
+    mask = rng.uniform(size=times.size) > 0.1
+    for lim_type in ["max", "min"]:
+        for limit in np.percentile(temp, [5, 50, 95]):
+            for load_start in [times[0] - 1.0, times[50] + 1.0, times[50]]:
+                for m in [None, mask]:
+                    viols = find_violations(times, temp, load_start, limit,
+                                            lim_type, mask=m)
+                    check_violations(viols, naive_violations(
+                        times, temp, load_start, limit, lim_type, mask=m))
+
+
+def test_find_violations_edges():
+    temp = np.zeros(times.size)
+    # Violations at the first two and the last two samples
+    temp[:2] = 40.0
+    temp[-2:] = 41.0
+    viols = find_violations(times, temp, times[0] - 1.0, 35.0, "max")
+    check_violations(viols, [(times[0], times[1], 0.328, 40.0),
+                             (times[-2], times[-1], 0.328, 41.0)])
+    # A violation of a single sample is shorter than 10 s
+    temp[-2] = 0.0
+    viols = find_violations(times, temp, times[0] - 1.0, 35.0, "max")
+    check_violations(viols, [(times[0], times[1], 0.328, 40.0)])
+    # The violation at the start is before the load
+    viols = find_violations(times, temp, times[1] + 1.0, 35.0, "max")
+    assert len(viols) == 0
+    # A violation which spans the start of the load starts there
+    temp[:10] = 40.0
+    viols = find_violations(times, temp, times[5], 35.0, "max")
+    check_violations(viols, naive_violations(times, temp, times[5], 35.0, "max"))
+    assert viols['tstart'][0] == times[5]
+
+
+def test_find_violations_none():
+    temp = np.full(times.size, 20.0)
+    assert len(find_violations(times, temp, times[0], 35.0, "max")) == 0
+    # Everything violates the limit, but nothing is checked
+    mask = np.zeros(times.size, dtype='bool')
+    temp[:] = 40.0
+    assert len(find_violations(times, temp, times[0] - 1.0, 35.0, "max",
+                               mask=mask)) == 0
+
+
+def test_find_limit_violations():
+    rng = np.random.default_rng(1234)
+    temp = 30.0 + np.cumsum(rng.normal(size=times.size))
+    mask = rng.uniform(size=times.size) > 0.3
+    # The last limit is checked only where the mask is True, and
+    # one limit is violated by every sample
+    limits = [("hi", np.percentile(temp, 80), "max", None),
+              ("lo", np.percentile(temp, 20), "min", None),
+              ("all", temp.min(), "max", None),
+              ("masked", np.percentile(temp, 50), "max", mask)]
+    load_start = times[20] + 1.0
+    viols = find_limit_violations(times, temp, load_start, limits)
+    assert list(viols.keys()) == ["hi", "lo", "all", "masked"]
+    for name, limit, lim_type, m in limits:
+        check_violations(viols[name], naive_violations(
+            times, temp, load_start, limit, lim_type, mask=m))
+    assert len(viols["all"]) == 1
+
+
+def test_find_limit_violations_at_limit():
+    # A temperature which is at the limit is a violation
+    temp = np.full(times.size, 20.0)
+    temp[10:20] = 35.0
+    temp[30:40] = 5.0
+    viols = find_limit_violations(times, temp, times[0] - 1.0,
+                                  [("hi", 35.0, "max", None),
+                                   ("lo", 5.0, "min", None)])
+    check_violations(viols["hi"], [(times[10], times[19],
+                                         (times[19] - times[10])*1.0e-3, 35.0)])
+    check_violations(viols["lo"], [(times[30], times[39],
+                                         (times[39] - times[30])*1.0e-3, 5.0)])
+
+
+def test_find_limit_violations_bad_type():
+    temp = np.full(times.size, 20.0)
+    with pytest.raises(RuntimeError):
+        find_limit_violations(times, temp, times[0],
+                              [("hi", 35.0, "maximum", None)])
+
+
+def naive_state_index(states, times):
+    # The last state which starts at or before each time, or the
+    # first state for times before the first state
+    idxs = []
+    for t in times:
+        idx = 0
+        for i, tstart in enumerate(states['tstart']):
+            if tstart <= t:
+                idx = i
+        idxs.append(idx)
+    return np.array(idxs)
+
+
+def test_state_index():
+    tstart = np.array([100.0, 200.0, 250.0, 400.0])
+    states = np.zeros(tstart.size, dtype=[('tstart', 'f8'), ('tstop', 'f8')])
+    states['tstart'] = tstart
+    states['tstop'] = np.append(tstart[1:], 500.0)
+    # Times before the first state, at the start of each state,
+    # between states, and after the last state
+    t = np.array([0.0, 99.9, 100.0, 150.0, 200.0, 249.9, 250.0,
+                  399.0, 400.0, 500.0, 1000.0])
+    idxs = state_index(states, t)
+    np.testing.assert_array_equal(idxs, [0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 3])
+    np.testing.assert_array_equal(idxs, naive_state_index(states, t))
+    rng = np.random.default_rng(7)
+    t = np.sort(rng.uniform(0.0, 600.0, size=500))
+    np.testing.assert_array_equal(state_index(states, t),
+                                  naive_state_index(states, t))
+
+
+def naive_interval_mask(times, intervals):
+    mask = np.zeros(times.size, dtype='bool')
+    for start, stop in intervals:
+        mask |= (times >= start) & (times < stop)
+    return mask
+
+
+def test_interval_mask():
+    t = np.arange(100.0)
+    # Unsorted, overlapping, nested, and touching intervals, an
+    # empty interval, and intervals outside of the times
+    intervals = [(50.0, 60.0), (10.0, 20.0), (15.0, 30.0), (12.0, 13.0),
+                 (30.0, 35.0), (70.0, 70.0), (-10.0, 2.0), (98.5, 200.0),
+                 (300.0, 400.0), (-50.0, -40.0)]
+    mask = interval_mask(t, intervals)
+    np.testing.assert_array_equal(mask, naive_interval_mask(t, intervals))
+    # Each interval includes its start but not its stop
+    assert mask[10] and mask[34] and not mask[35]
+    assert not mask[70]
+    rng = np.random.default_rng(23)
+    t = np.sort(rng.uniform(0.0, 1000.0, size=1000))
+    starts = rng.uniform(0.0, 1000.0, size=50)
+    intervals = list(zip(starts, starts + rng.uniform(0.0, 50.0, size=50)))
+    np.testing.assert_array_equal(interval_mask(t, intervals),
+                                  naive_interval_mask(t, intervals))
+
+
+def test_interval_mask_empty():
+    t = np.arange(10.0)
+    mask = interval_mask(t, [])
+    assert mask.dtype == bool
+    assert mask.size == 10 and not mask.any()
+    assert interval_mask(np.zeros(0), [(1.0, 2.0)]).size == 0
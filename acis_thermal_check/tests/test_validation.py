@@ -0,0 +1,104 @@
+import pickle
+import numpy as np
+import pytest
+from acis_thermal_check.validation import calc_quantiles, ResidualStats, \
+    validation_quantiles, write_validation_data, read_validation_data
+
+
+def naive_quantiles(x, quantiles=validation_quantiles):
+    # The quantiles as order statistics of the fully sorted array
+    x = np.sort(x)
+    return {quant: x[(len(x) * quant) // 100] for quant in quantiles}
+
+
+def test_calc_quantiles():
+    rng = np.random.default_rng(21)
+    for n in [1, 2, 7, 100, 1001]:
+        x = rng.normal(size=n)
+        assert calc_quantiles(x) == naive_quantiles(x)
+    # Repeated values, and quantiles which share an order statistic
+    x = np.array([3.0, 1.0, 2.0, 2.0, 3.0])
+    assert calc_quantiles(x) == naive_quantiles(x)
+    assert calc_quantiles(x, quantiles=(0, 50, 99)) == \
+        naive_quantiles(x, quantiles=(0, 50, 99))
+    # The array is not changed
+    x = rng.normal(size=50)
+    x0 = x.copy()
+    calc_quantiles(x)
+    np.testing.assert_array_equal(x, x0)
+
+
+def test_residual_stats():
+    rng = np.random.default_rng(22)
+    diff = rng.normal(size=500)
+    diff2 = rng.normal(size=200)
+    stats = ResidualStats("1dpamzt", diff, diff2=diff2, fmt="%.3f")
+    assert stats.quantiles == naive_quantiles(diff)
+    for hist, d in [(stats.hist, diff), (stats.hist2, diff2)]:
+        counts, edges = np.histogram(d, bins=50)
+        np.testing.assert_array_equal(hist[0], counts)
+        np.testing.assert_array_equal(hist[1], edges)
+    d = stats.as_dict()
+    assert d["msid"] == "1DPAMZT"
+    assert d["quant50"] == "%.3f" % naive_quantiles(diff)[50]
+    assert ResidualStats("pitch", diff).hist2 is None
+
+
+def make_validation_data():
+    rng = np.random.default_rng(24)
+    n = 100
+    pred = {"1dpamzt": rng.normal(size=n), "pitch": rng.normal(size=n),
+            "tscpos": rng.normal(size=n)}
+    tlm = np.zeros(n, dtype=[("date", "f8"), ("1dpamzt", "f8"),
+                             ("pitch", "f8"), ("tscpos", "f8"),
+                             ("ccd_count", "i4")])
+    tlm["date"] = 6.0e8 + 328.0*np.arange(n)
+    for name in ["1dpamzt", "pitch", "tscpos"]:
+        tlm[name] = rng.normal(size=n)
+    tlm["ccd_count"] = rng.integers(0, 7, size=n)
+    return pred, tlm
+
+
+def check_validation_data(data, pred, tlm):
+    assert list(data["pred"].keys()) == list(pred.keys())
+    assert list(data["tlm"].keys()) == list(tlm.dtype.names)
+    for key in pred:
+        np.testing.assert_array_equal(data["pred"][key], pred[key])
+    for name in tlm.dtype.names:
+        assert data["tlm"][name].dtype == tlm[name].dtype
+        np.testing.assert_array_equal(data["tlm"][name], tlm[name])
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_validation_data_npz(tmp_path, mmap):
+    pred, tlm = make_validation_data()
+    filename = str(tmp_path / "validation_data.npz")
+    write_validation_data(filename, pred, tlm)
+    data = read_validation_data(filename, mmap=mmap)
+    assert data["version"] == 1
+    check_validation_data(data, pred, tlm)
+    # The columns are memory-mapped if requested
+    assert isinstance(data["tlm"]["1dpamzt"], np.memmap) == mmap
+
+
+def test_validation_data_pickle(tmp_path):
+    # The pickle files written by older versions
+    pred, tlm = make_validation_data()
+    filename = str(tmp_path / "validation_data.pkl")
+    with open(filename, "wb") as f:
+        pickle.dump({'pred': pred, 'tlm': tlm}, f, protocol=2)
+    data = read_validation_data(filename)
+    assert data["version"] == 0
+    check_validation_data(data, pred, tlm)
+
+
+def test_validation_data_newer(tmp_path):
+    pred, tlm = make_validation_data()
+    filename = str(tmp_path / "validation_data.npz")
+    write_validation_data(filename, pred, tlm)
+    with np.load(filename) as npz:
+        arrays = dict(npz)
+    arrays["version"] = np.array(2)
+    np.savez(filename, **arrays)
+    with pytest.raises(RuntimeError):
+        read_validation_data(filename)
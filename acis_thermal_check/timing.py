@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+from acis_thermal_check.utils import mylog
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_peak_memory():
+    """
+    Get the high-water mark of the resident memory of this process
+    in MB, i.e. the most it has used at any time since it started,
+    or None if it cannot be determined on this platform.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return maxrss / 1024.0**2
+    return maxrss / 1024.0
+
+
+class StageTimer(object):
+    """
+    Record the wall time, the CPU time, and the memory used by each
+    stage of a model run. Since only the high-water mark of the memory
+    of the whole process is available, what is recorded for each stage
+    is the high-water mark at the end of the stage ("memory_hwm") and
+    how much the stage raised it ("memory_increase"), which is zero
+    for a stage which never used more memory than was used before it.
+    Stages are timed with the :meth:`stage`
+    context manager, and may be nested, in which case the name of a
+    nested stage is prefixed with the names of the stages which
+    contain it, separated by ".". If the same stage is run more than
+    once, the times are added up and the number of calls is counted.
+
+    Parameters
+    ----------
+    profile_dir : string, optional
+        If set, each stage which is not nested in another stage is
+        also profiled with cProfile, and the profile is written to
+        "profile_<stage>.prof" in this directory. Default: None
+    """
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.timings = {}
+        self._stack = []
+        self._started = []
+
+    def start(self, name):
+        """
+        Start timing a stage of the run, which is stopped by
+        :meth:`stop`. Use :meth:`stage` where possible instead.
+
+        Parameters
+        ----------
+        name : string
+            The name of the stage.
+        """
+        self._stack.append(name)
+        # Add the stage when it starts, so that the stages are
+        # listed in the order in which they were started
+        self.timings.setdefault(".".join(self._stack),
+                                {"calls": 0, "wall": 0.0, "cpu": 0.0,
+                                 "memory_hwm": None, "memory_increase": None})
+        profiler = None
+        if self.profile_dir is not None and len(self._stack) == 1:
+            import cProfile
+            profiler = cProfile.Profile()
+        self._started.append((time.perf_counter(), time.process_time(),
+                              get_peak_memory(), profiler))
+        if profiler is not None:
+            profiler.enable()
+
+    def stop(self):
+        """
+        Stop timing the stage which was started last.
+        """
+        wall0, cpu0, mem0, profiler = self._started.pop()
+        if profiler is not None:
+            profiler.disable()
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+        full_name = ".".join(self._stack)
+        name = self._stack.pop()
+        t = self.timings[full_name]
+        t["calls"] += 1
+        t["wall"] += wall
+        t["cpu"] += cpu
+        mem = get_peak_memory()
+        if mem is not None:
+            t["memory_hwm"] = mem
+            t["memory_increase"] = (t["memory_increase"] or 0.0) + mem - mem0
+        if profiler is not None:
+            # The first stages of a run may end before the output
+            # directory has been made
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.profile_dir,
+                                             "profile_%s.prof" % name))
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a stage of the run, e.g.::
+
+            with self.timer.stage("model_calc"):
+                model.calc()
+
+        Parameters
+        ----------
+        name : string
+            The name of the stage.
+        """
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def log(self):
+        """
+        Write a table of the timings of the stages to the log.
+        """
+        mylog.info("Timings of the stages of the run:")
+        mylog.info("%-40s %6s %10s %10s %14s %14s" %
+                   ("stage", "calls", "wall (s)", "CPU (s)",
+                    "mem incr (MB)", "mem hwm (MB)"))
+        for name, t in self.timings.items():
+            mem = ["" if t[key] is None else "%.1f" % t[key]
+                   for key in ("memory_increase", "memory_hwm")]
+            mylog.info("%-40s %6d %10.3f %10.3f %14s %14s" %
+                       (name, t["calls"], t["wall"], t["cpu"], mem[0], mem[1]))
+
+    def write(self, outdir):
+        """
+        Write the timings of the stages to "timings.json".
+
+        Parameters
+        ----------
+        outdir : string
+            The path to the output directory.
+        """
+        outfile = os.path.join(outdir, "timings.json")
+        mylog.info("Writing timings to %s" % outfile)
+        with open(outfile, "w") as f:
+            json.dump(self.timings, f, indent=4)
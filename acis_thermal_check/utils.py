@@ -1,10 +1,6 @@
 import numpy as np
-import Ska.Sun
 import logging
 import os
-import matplotlib.pyplot as plt
-from Ska.Matplotlib import cxctime2plotdate
-import Ska.Numpy
 
 TASK_DATA = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -14,6 +10,92 @@ thermal_blue = 'blue'
 thermal_red = 'red'
 
 
+def get_pyplot():
+    """
+    Import matplotlib.pyplot, using the Agg backend for
+    command-line (non-interactive) operation. Matplotlib is
+    only imported when plots are made, so that runs which do
+    not make plots do not pay the cost of importing it.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def state_index(states, times):
+    """
+    Find the index of the commanded state which is in effect at
+    each of a set of times, i.e. the last state which starts at
+    or before each time. Times before the first state are given
+    the first state, and times after the last state are given the
+    last state.
+
+    Parameters
+    ----------
+    states : commanded states NumPy recarray
+    times : NumPy array of times in seconds
+
+    Returns
+    -------
+    NumPy integer array of the state indexes
+    """
+    idxs = np.searchsorted(states['tstart'], times, side='right') - 1
+    return np.clip(idxs, 0, len(states) - 1)
+
+
+def interval_mask(times, intervals):
+    """
+    Find which of a set of times fall within any of a number of time
+    intervals, e.g. the bad times of a model or the perigee passages.
+    The intervals are converted to seconds all at once, sorted, and
+    merged where they overlap, and the mask is built by searching for
+    the merged intervals in the times, which takes O(N + M log M) for
+    N times and M intervals.
+
+    Parameters
+    ----------
+    times : NumPy array
+        The times in seconds from the beginning of the mission, which
+        must be sorted.
+    intervals : sequence of 2-tuples
+        The (start, stop) of each interval, either as dates or as times
+        in seconds. An interval includes its start but not its stop.
+
+    Returns
+    -------
+    A NumPy boolean array which is True for the times which fall
+    within any of the intervals.
+    """
+    times = np.asarray(times)
+    mask = np.zeros(times.size, dtype='bool')
+    if len(intervals) == 0:
+        return mask
+    intervals = np.asarray(intervals)
+    if intervals.dtype.kind in "fiu":
+        secs = intervals.astype("float64").reshape(-1, 2)
+    else:
+        from cxotime import CxoTime
+        secs = CxoTime(intervals.ravel()).secs.reshape(-1, 2)
+    secs = secs[np.argsort(secs[:, 0], kind='mergesort')]
+    starts = secs[:, 0]
+    # The stop of each merged interval is the latest stop of the
+    # intervals in it, and a new one begins with each start which
+    # is after all of the stops before it
+    stops = np.maximum.accumulate(secs[:, 1])
+    new = np.ones(starts.size, dtype='bool')
+    new[1:] = starts[1:] > stops[:-1]
+    last = np.append(np.flatnonzero(new)[1:] - 1, starts.size - 1)
+    i0 = np.searchsorted(times, starts[new], side='left')
+    i1 = np.searchsorted(times, stops[last], side='left')
+    i1 = np.maximum(i0, i1)
+    # Mark the start and the end of each interval and add them up
+    edges = np.bincount(i0, minlength=times.size + 1) - \
+        np.bincount(i1, minlength=times.size + 1)
+    mask[:] = np.cumsum(edges[:-1]) > 0
+    return mask
+
+
 def calc_pitch_roll(times, ephem, states):
     """Calculate the normalized sun vector in body coordinates.
     Shamelessly copied from Ska.engarchive.derived.pcad but 
@@ -30,9 +112,8 @@ def calc_pitch_roll(times, ephem, states):
     3 NumPy arrays: time, pitch and roll
     """
     from Ska.engarchive.derived.pcad import arccos_clip, qrotate
-    idxs = Ska.Numpy.interpolate(np.arange(len(states)), states['tstart'],
-                                 times, method='nearest')
-    states = states[idxs]
+    # Only gather the quaternions of the states at each time
+    idxs = state_index(states, times)
 
     chandra_eci = np.array([ephem['orbitephem0_x'],
                             ephem['orbitephem0_y'],
@@ -41,10 +122,10 @@ def calc_pitch_roll(times, ephem, states):
                         ephem['solarephem0_y'],
                         ephem['solarephem0_z']])
     sun_vec = -chandra_eci + sun_eci
-    est_quat = np.array([states['q1'],
-                         states['q2'],
-                         states['q3'],
-                         states['q4']])
+    est_quat = np.array([states['q1'][idxs],
+                         states['q2'][idxs],
+                         states['q3'][idxs],
+                         states['q4'][idxs]])
 
     sun_vec_b = qrotate(est_quat, sun_vec)  # Rotate into body frame
     magnitude = np.sqrt((sun_vec_b ** 2).sum(axis=0))
@@ -57,6 +138,141 @@ def calc_pitch_roll(times, ephem, states):
     return pitch, roll
 
 
+def find_violations(times, temp, load_start, limit, lim_type, mask=None):
+    """
+    Find the time intervals where a temperature violates a limit,
+    in a single vectorized pass over the temperature array.
+
+    Parameters
+    ----------
+    times : NumPy array
+        The times of the temperatures in seconds from the beginning
+        of the mission.
+    temp : NumPy array
+        The temperatures.
+    load_start : float
+        The start time of the load. Only violations which occur
+        after this time are reported.
+    limit : float
+        The value of the limit.
+    lim_type : string
+        "max" if the temperature should not be above the limit,
+        "min" if it should not be below it.
+    mask : NumPy boolean array, optional
+        If supplied, only times where the mask is True are checked
+        for violations.
+
+    Returns
+    -------
+    A NumPy structured array with one row for each violation longer
+    than 10 s, with the fields "datestart", "datestop", "tstart",
+    "tstop", "duration" (in ks), and "extemp" (the extreme value
+    of the temperature during the violation).
+    """
+    limits = [("limit", limit, lim_type, mask)]
+    return find_limit_violations(times, temp, load_start, limits)["limit"]
+
+
+def find_limit_violations(times, temp, load_start, limits):
+    """
+    Find the time intervals where a temperature violates any of
+    a number of limits, checking all of the limits at once in a
+    single vectorized pass over the temperature array.
+
+    Parameters
+    ----------
+    times : NumPy array
+        The times of the temperatures in seconds from the beginning
+        of the mission.
+    temp : NumPy array
+        The temperatures.
+    load_start : float
+        The start time of the load. Only violations which occur
+        after this time are reported.
+    limits : list of tuples
+        The limits to check, as (name, limit, lim_type, mask) tuples,
+        where *lim_type* is "max" if the temperature should not be
+        above the limit and "min" if it should not be below it, and
+        *mask* is either None or a boolean array which is True where
+        the limit applies.
+
+    Returns
+    -------
+    A dictionary of NumPy structured arrays keyed by the limit name,
+    each with one row for each violation longer than 10 s, with the
+    fields "datestart", "datestop", "tstart", "tstop", "duration"
+    (in ks), and "extemp" (the extreme value of the temperature during
+    the violation).
+    """
+    from cxotime import CxoTime
+    dtype = [('datestart', 'U21'), ('datestop', 'U21'), ('tstart', 'f8'),
+             ('tstop', 'f8'), ('duration', 'f8'), ('extemp', 'f8')]
+    nlimits = len(limits)
+    thresholds = np.array([limit[1] for limit in limits], dtype='f8')
+    for limit in limits:
+        if limit[2] not in ["max", "min"]:
+            raise RuntimeError("Invalid limit type %s!" % limit[2])
+    is_max = np.array([limit[2] == "max" for limit in limits])
+    # Flipping the sign of the temperatures and the thresholds of
+    # the "min" limits lets us compare against all of the limits at
+    # once, one row for each limit
+    sign = np.where(is_max, 1.0, -1.0)[:, np.newaxis]
+    bad = np.zeros((nlimits, temp.size+2), dtype='bool')
+    bad[:, 1:-1] = sign*temp >= sign*thresholds[:, np.newaxis]
+    for i, limit in enumerate(limits):
+        if limit[3] is not None:
+            bad[i, 1:-1] &= limit[3]
+    # The NumPy black magic of the next two lines is to figure
+    # out which time periods have limit violations and to find
+    # the bounding indexes of these times. This will also find
+    # violations which happen for one discrete time value also.
+    # The rows are padded with False, so the changes always come
+    # in pairs within each row.
+    rows, cols = np.nonzero(bad[:, 1:] != bad[:, :-1])
+    changes = cols.reshape(-1, 2)
+    rows = rows[::2]
+    i0, i1 = changes[:, 0], changes[:, 1]
+    # Only report violations which occur after the load being
+    # reviewed starts, and which last at least 10 s.
+    t0 = times[i0]
+    in_load = (t0 > load_start) | \
+        ((t0 < load_start) & (load_start < times[np.minimum(i1, times.size-1)]))
+    tstart = np.where(t0 > load_start, t0, load_start)
+    tstop = times[i1-1]
+    duration = tstop - tstart
+    ok = in_load & (duration >= 10.0)
+    # The extreme temperature of each interval, found by reducing
+    # over the [i0, i1) pairs. The temperature array is padded by
+    # one element so that i1 can be equal to its length.
+    extemp = np.zeros(i0.size)
+    if i0.size > 0:
+        temp_ext = np.append(temp, temp[-1])
+        extemp = np.where(is_max[rows],
+                          np.maximum.reduceat(temp_ext, changes.ravel())[::2],
+                          np.minimum.reduceat(temp_ext, changes.ravel())[::2])
+    # Convert all of the start and stop times to dates at once
+    nviols = ok.sum()
+    if nviols > 0:
+        dates = CxoTime(np.concatenate([tstart[ok], tstop[ok]])).date
+    else:
+        dates = np.zeros(0, dtype='U21')
+    datestart = dates[:nviols]
+    datestop = dates[nviols:]
+    rows = rows[ok]
+    viols = {}
+    for i, limit in enumerate(limits):
+        these = rows == i
+        limit_viols = np.zeros(these.sum(), dtype=dtype)
+        limit_viols['datestart'] = datestart[these]
+        limit_viols['datestop'] = datestop[these]
+        limit_viols['tstart'] = tstart[ok][these]
+        limit_viols['tstop'] = tstop[ok][these]
+        limit_viols['duration'] = duration[ok][these]*1.0e-3
+        limit_viols['extemp'] = extemp[ok][these]
+        viols[limit[0]] = limit_viols
+    return viols
+
+
 def config_logging(outdir, verbose):
     """
     Set up file and console logger.
@@ -84,6 +300,13 @@ def config_logging(outdir, verbose):
     logger = logging.getLogger('acis_thermal_check')
     logger.setLevel(logging.DEBUG)
 
+    # Remove the handlers from any previous run in this process, e.g.
+    # when several models are run one after another, so that each
+    # run.dat only contains the log of its own run
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
     # Set numerical values for the different log levels
     loglevel = {0: logging.CRITICAL,
                 1: logging.INFO,
@@ -154,6 +377,9 @@ def plot_one(fig_id, x, y, yy=None, linestyle='-',
     figsize : 2-tuple of floats
         Size of plot in width and height in inches.
     """
+    import Ska.Matplotlib
+    from Ska.Matplotlib import cxctime2plotdate
+    plt = get_pyplot()
     # Convert times to dates
     xt = cxctime2plotdate(x)
     fig = plt.figure(fig_id, figsize=figsize)
@@ -259,6 +485,9 @@ def plot_two(fig_id, x, y, x2, y2, yy=None, linewidth=2,
     figsize : 2-tuple of floats
         Size of plot in width and height in inches.
     """
+    import Ska.Matplotlib
+    from Ska.Matplotlib import cxctime2plotdate
+    plt = get_pyplot()
     # Convert times to dates
     xt = cxctime2plotdate(x)
     fig = plt.figure(fig_id, figsize=figsize)
@@ -321,7 +550,72 @@ def plot_two(fig_id, x, y, x2, y2, yy=None, linewidth=2,
     return {'fig': fig, 'ax': ax, 'ax2': ax2}
 
 
-def get_options(name, model_path, opts=None):
+def _save_figure(fig_pickle, outfile):
+    # Unpickle a figure and save it, in a worker process
+    import pickle
+    fig = pickle.loads(fig_pickle)
+    fig.savefig(outfile)
+
+
+def save_figures(figures, nprocs=1, timer=None):
+    """
+    Render and save a number of figures to files, optionally in
+    parallel using a pool of processes. The figures are pickled and
+    sent to the worker processes, which do the rendering and the
+    PNG encoding. Any figure which cannot be pickled is saved in
+    this process instead.
+
+    Parameters
+    ----------
+    figures : list of (Figure, string) tuples
+        The figures to save and the files to save them to. If the
+        same file appears more than once, it is only written once.
+    nprocs : integer, optional
+        The number of processes to use. Default: 1, which saves all
+        of the figures in this process.
+    timer : StageTimer, optional
+        If set, the time spent saving each figure is recorded as a
+        stage named "savefig_<file name>" when the figures are saved
+        in this process, or else the time spent saving all of them as
+        a stage named "savefig". Default: None
+    """
+    import pickle
+    from contextlib import nullcontext
+    to_save = {}
+    for fig, outfile in figures:
+        to_save[outfile] = fig
+    if nprocs <= 1 or len(to_save) <= 1:
+        for outfile, fig in to_save.items():
+            mylog.info('Writing plot file %s' % outfile)
+            if timer is None:
+                stage = nullcontext()
+            else:
+                name = os.path.splitext(os.path.basename(outfile))[0]
+                stage = timer.stage("savefig_%s" % name)
+            with stage:
+                fig.savefig(outfile)
+        return
+    if timer is None:
+        stage = nullcontext()
+    else:
+        stage = timer.stage("savefig")
+    from concurrent.futures import ProcessPoolExecutor
+    with stage:
+        futures = []
+        with ProcessPoolExecutor(max_workers=nprocs) as executor:
+            for outfile, fig in to_save.items():
+                mylog.info('Writing plot file %s' % outfile)
+                try:
+                    fig_pickle = pickle.dumps(fig)
+                except Exception:
+                    fig.savefig(outfile)
+                    continue
+                futures.append(executor.submit(_save_figure, fig_pickle, outfile))
+            for future in futures:
+                future.result()
+
+
+def get_options(name, model_path, opts=None, argv=None):
     """
     Construct the argument parser for command-line options for running
     predictions and validations for a load. Sets up the parser and 
@@ -338,6 +632,9 @@ def get_options(name, model_path, opts=None):
     opts: dictionary
         A (key, value) dictionary of additional options for the parser. These
         may be defined by the thermal model checking tool if necessary.
+    argv : list of strings, optional
+        The command-line arguments to parse. Default: None, which
+        parses ``sys.argv``. Pass an empty list to get the defaults.
     """
     from argparse import ArgumentParser
     parser = ArgumentParser()
@@ -374,13 +671,53 @@ def get_options(name, model_path, opts=None):
                         default='/data/acis/LoadReviews/NonLoadTrackedEvents.txt',
                         help="Full path to the Non-Load Event Tracking file that should be "
                              "used for this model run.")
+    parser.add_argument("--cache-dir",
+                        help="Directory for the on-disk cache of telemetry and other "
+                             "inputs. Default is to use the ACIS_THERMAL_CHECK_CACHE "
+                             "environment variable, or to not cache if it is not set.")
+    parser.add_argument("--plot-nprocs", type=int, default=1,
+                        help="Number of processes to use to render and save the plots. "
+                             "Default: 1")
+    parser.add_argument("--ensemble-size", type=int, default=0,
+                        help="Number of members of an ensemble of predictions with "
+                             "perturbed initial temperatures and model parameters. "
+                             "Default: 0, which is no ensemble.")
+    parser.add_argument("--ensemble-T-sigma", type=float, default=1.0,
+                        help="Standard deviation of the initial temperature of the "
+                             "ensemble members (degC). Default: 1.0")
+    parser.add_argument("--ensemble-par-sigma", type=float, default=0.01,
+                        help="Standard deviation of the free model parameters of the "
+                             "ensemble members, as a fraction of their values. "
+                             "Default: 0.01")
+    parser.add_argument("--ensemble-seed", type=int,
+                        help="Seed for the random perturbations of the ensemble "
+                             "members. Default: None")
+    parser.add_argument("--ensemble-nprocs", type=int, default=1,
+                        help="Number of processes to use to run the ensemble. "
+                             "Default: 1")
+    parser.add_argument("--data-only", action='store_true',
+                        help="Only write the temperatures, states, violations, and "
+                             "validation statistics as data files (results.json and "
+                             "results.npz), without making plots or the web page. "
+                             "Default: False")
+    parser.add_argument("--write-npz", action='store_true',
+                        help="Also write the temperatures and states to the binary "
+                             "files temperatures.npz and states.npz. Default: False")
+    parser.add_argument("--valid-stats-only", action='store_true',
+                        help="Only compute the validation statistics and violations, "
+                             "and write them to validation_quant.csv and "
+                             "validation.json, without making predictions, plots, or "
+                             "the web page. Default: False")
+    parser.add_argument("--profile", action='store_true',
+                        help="Profile each stage of the run with cProfile, and write "
+                             "the profiles to outdir. Default: False")
     parser.add_argument("--version", action='store_true', help="Print version")
 
     if opts is not None:
         for opt_name, opt in opts:
             parser.add_argument("--%s" % opt_name, **opt)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.oflsdir is not None:
         args.backstop_file = args.oflsdir
@@ -434,19 +771,278 @@ def make_state_builder(name, args):
     return state_builder
 
 
-def get_acis_limits(msid):
+# The directories which are searched for templates, in order. Model
+# packages may add their own with register_template_dir.
+_template_dirs = [os.path.join(TASK_DATA, 'acis_thermal_check', 'templates')]
+
+# The jinja2 environment, and the cache directory it was set up with
+_template_env = None
+_template_cache_dir = None
+
+
+def register_template_dir(template_dir):
+    """
+    Add a directory of templates which override the templates
+    of the same name in ``acis_thermal_check``, e.g. a model
+    package's own ``index_template.rst``. Directories which are
+    registered later take precedence over those registered earlier.
+
+    Parameters
+    ----------
+    template_dir : string
+        The path to the directory of templates.
+    """
+    global _template_env
+    template_dir = os.path.abspath(template_dir)
+    if template_dir in _template_dirs:
+        _template_dirs.remove(template_dir)
+    _template_dirs.insert(0, template_dir)
+    # The environment is set up again with the new search path
+    _template_env = None
+
+
+def get_template(name):
+    """
+    Get a jinja2 template from the template directories. The
+    templates are only parsed once per process, and if the on-disk
+    cache is turned on the compiled templates are also kept there,
+    so they are only parsed once per machine.
+
+    Parameters
+    ----------
+    name : string
+        The name of the template file, e.g. "index_template.rst".
+    """
+    global _template_env, _template_cache_dir
+    import re
+    import jinja2
+    from acis_thermal_check.cache import get_cache_dir
+    cache_dir = get_cache_dir("templates")
+    if _template_env is None or cache_dir != _template_cache_dir:
+
+        class TemplateLoader(jinja2.FileSystemLoader):
+            # Remove the newline after each block tag, which
+            # the reST templates are written to expect
+            def get_source(self, environment, template):
+                source, filename, uptodate = \
+                    super().get_source(environment, template)
+                return re.sub(r' %}\n', ' %}', source), filename, uptodate
+
+        if cache_dir is None:
+            bytecode_cache = None
+        else:
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+        _template_env = jinja2.Environment(loader=TemplateLoader(list(_template_dirs)),
+                                           bytecode_cache=bytecode_cache)
+        _template_cache_dir = cache_dir
+    return _template_env.get_template(name)
+
+
+# The limits read from limits.yml files, keyed by file name,
+# along with the modification times of the files
+_limits_registry = {}
+
+
+def get_limits(msid, limits_file=None):
+    """
+    Get the thermal limits for an MSID, e.g. the planning and yellow
+    limits. The limits file is only parsed once per process, unless
+    it is modified.
+
+    Parameters
+    ----------
+    msid : string
+        The MSID to get the limits for, e.g. "1deamzt".
+    limits_file : string, optional
+        The path to the YAML file of limits. Default: the "limits.yml"
+        file in ``acis_thermal_check``.
+
+    Returns
+    -------
+    A dictionary of the limits, keyed by name, e.g. "plan_hi".
+    """
+    import yaml
+    try:
+        from yaml import CSafeLoader as Loader
+    except ImportError:
+        from yaml import SafeLoader as Loader
+    if limits_file is None:
+        limits_file = os.path.join(TASK_DATA, 'acis_thermal_check',
+                                   'data', 'limits.yml')
+    mtime = os.stat(limits_file).st_mtime_ns
+    cached = _limits_registry.get(limits_file)
+    if cached is None or cached[0] != mtime:
+        with open(limits_file, "r") as f:
+            cached = (mtime, yaml.load(f, Loader=Loader))
+        _limits_registry[limits_file] = cached
+    return dict(cached[1][msid])
+
+
+# The parsed detector housing heater histories, keyed by file
+# name, along with the modification times of the files
+_dh_heater_history = {}
+
+
+def read_dh_heater_history(filename):
+    """
+    Read the history of the detector housing heater commands from
+    an RDB file. The parsed history is kept in memory for the rest
+    of the process, and if the on-disk cache is turned on it is also
+    stored there as a .npz file, so that the RDB file only has to be
+    parsed again when it is modified.
+
+    Parameters
+    ----------
+    filename : string
+        The path to the RDB file, e.g. "dahtbon_history.rdb".
+
+    Returns
+    -------
+    A 2-tuple of NumPy arrays: the times in seconds from the beginning
+    of the mission and the heater on/off states.
+    """
+    import hashlib
+    from acis_thermal_check.cache import get_cache_dir, save_npz
+    filename = os.path.abspath(filename)
+    mtime = os.stat(filename).st_mtime_ns
+    cached = _dh_heater_history.get(filename)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    history = None
+    cache_dir = get_cache_dir("dh_heater")
+    if cache_dir is not None:
+        digest = hashlib.md5(filename.encode("utf-8")).hexdigest()
+        cache_file = os.path.join(cache_dir, "%s.npz" % digest)
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as f:
+                if f["mtime"] == mtime:
+                    history = f["times"], f["dahtbon"]
+    if history is None:
+        from astropy.io import ascii
+        from cxotime import CxoTime
+        mylog.info('Reading file of dahtrb commands from file %s' % filename)
+        htrb = ascii.read(filename, format='rdb')
+        history = CxoTime(htrb['time']).secs, htrb['dahtbon'].astype(bool)
+        if cache_dir is not None:
+            save_npz(cache_file, times=history[0], dahtbon=history[1],
+                     mtime=np.array(mtime))
+    _dh_heater_history[filename] = (mtime, history)
+    return history
+
+
+# The parsed ACIS limits files, keyed by source, along with the
+# modification time or ETag of each file when it was parsed
+_acis_limits_index = {}
+
+
+def _index_limits_lines(lines):
+    # Map the first word of each line (the MSID) to its words
+    index = {}
+    for line in lines:
+        words = line.strip().split()
+        if len(words) > 1:
+            index.setdefault(words[0], words)
+    return index
+
+
+def _limits_file_version(meta):
+    # The version of a limits file from the web site, from the
+    # headers of the response which were stored with it
+    return meta.get("etag", meta.get("last_modified"))
+
+
+def _get_remote_limits_lines(url, offline, timeout):
+    # Get the lines of a limits file from the web site, using the copy
+    # in the on-disk cache if it is still current (or if we cannot or
+    # should not reach the web site), and its version, which is its
+    # ETag or Last-Modified date (or None if the server gave neither)
+    import json
+    import tempfile
+    import hashlib
+    from acis_thermal_check.cache import get_cache_dir
+    cache_dir = get_cache_dir("acis_limits")
+    text = None
+    meta = {}
+    if cache_dir is not None:
+        digest = hashlib.md5(url.encode("utf-8")).hexdigest()
+        text_file = os.path.join(cache_dir, "%s.txt" % digest)
+        meta_file = os.path.join(cache_dir, "%s.json" % digest)
+        if os.path.exists(text_file) and os.path.exists(meta_file):
+            with open(text_file, "r") as f:
+                text = f.read()
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+    if offline:
+        if text is None:
+            raise RuntimeError("No cached copy of %s is available in offline mode!" % url)
+        mylog.info("Using the cached copy of %s in offline mode." % url)
+        return text.split("\n"), _limits_file_version(meta)
+    import requests
+    headers = {}
+    if text is not None:
+        if "etag" in meta:
+            headers["If-None-Match"] = meta["etag"]
+        if "last_modified" in meta:
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        u = requests.get(url, headers=headers, timeout=timeout)
+        if u.status_code != 304:
+            u.raise_for_status()
+    except requests.RequestException as e:
+        if text is None:
+            raise
+        mylog.warning("Could not get %s (%s), so the last cached copy "
+                      "will be used." % (url, e))
+        return text.split("\n"), _limits_file_version(meta)
+    if u.status_code == 304:
+        return text.split("\n"), _limits_file_version(meta)
+    meta = {}
+    if "ETag" in u.headers:
+        meta["etag"] = u.headers["ETag"]
+    if "Last-Modified" in u.headers:
+        meta["last_modified"] = u.headers["Last-Modified"]
+    if cache_dir is not None:
+        # Write each file to a unique temporary file first, since
+        # several processes may be updating the cache at once
+        for fn, contents in [(text_file, u.text), (meta_file, json.dumps(meta))]:
+            fd, tmpfile = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(contents)
+                os.replace(tmpfile, fn)
+            except Exception:
+                os.remove(tmpfile)
+                raise
+    return u.text.split("\n"), _limits_file_version(meta)
+
+
+def get_acis_limits(msid, offline=None, timeout=10.0):
     """
     Get the current yellow hi limit and margin for a 
     given ACIS-related MSID, or the various limits 
     for the focal plane temperature.
 
+    The limits files are read from the local web directory if it
+    is available, or else from the web site. Each file is only
+    parsed once per process (unless the local file is modified),
+    and if the on-disk cache is turned on the files from the web
+    site are kept there, so that they are only downloaded again
+    when they change, and can be used when the web site cannot be
+    reached.
+
     Parameters
     ----------
     msid : string
         The MSID to get the limits for, e.g. "1deamzt".
+    offline : boolean, optional
+        If True, do not contact the web site, and use the copy of the
+        limits file in the on-disk cache. Default: None, which is True
+        if the ACIS_THERMAL_CHECK_OFFLINE environment variable is set
+        to "1", "true", or "yes" (in any case).
+    timeout : float, optional
+        The time in seconds to wait for the web site to respond.
+        Default: 10.0
     """
-    import requests
-
     if msid == "fptemp":
         cold_ecs = -119.5 # the limit for cold ECS measurements in the science orbit
         acis_i = -112.0 # the limit for ACIS-I observations
@@ -454,6 +1050,10 @@ def get_acis_limits(msid):
         acis_hot = -109.0 # the limit for ACIS-S observations which can go hotter
         return cold_ecs, acis_i, acis_s, acis_hot
 
+    if offline is None:
+        offline = os.environ.get("ACIS_THERMAL_CHECK_OFFLINE", "").strip().lower() \
+            in ("1", "true", "yes")
+
     yellow_lo = None
     yellow_hi = None
 
@@ -480,23 +1080,27 @@ def get_acis_limits(msid):
 
     if os.path.exists(file_root):
         loc = "local"
-        f = open(os.path.join(file_root, limits_file), "r")
-        lines = f.readlines()
-        f.close()
+        source = os.path.join(file_root, limits_file)
+        version = os.stat(source).st_mtime_ns
+        cached = _acis_limits_index.get(source)
+        if cached is None or cached[0] != version:
+            with open(source, "r") as f:
+                index = _index_limits_lines(f.readlines())
+            _acis_limits_index[source] = (version, index)
     else:
         loc = "remote"
-        url = "http://cxc.cfa.harvard.edu/acis/{}".format(limits_file)
-        u = requests.get(url)
-        lines = u.text.split("\n")
+        source = "http://cxc.cfa.harvard.edu/acis/{}".format(limits_file)
+        # The file from the web site is only obtained once per process
+        if source not in _acis_limits_index:
+            lines, version = _get_remote_limits_lines(source, offline, timeout)
+            _acis_limits_index[source] = (version, _index_limits_lines(lines))
 
     mylog.info("Obtaining limits for %s from %s file." % (msid, loc))
 
-    for line in lines:
-        words = line.strip().split()
-        if len(words) > 1 and words[0] == msid.upper():
-            yellow_lo = float(words[cols[0]])
-            yellow_hi = float(words[cols[1]])
-            break
+    words = _acis_limits_index[source][1].get(msid.upper())
+    if words is not None:
+        yellow_lo = float(words[cols[0]])
+        yellow_hi = float(words[cols[1]])
 
     return yellow_lo, yellow_hi, margin
 
@@ -519,6 +1123,7 @@ def paint_perigee(perigee_passages, states, plots):
     #
     # Now plot any perigee passages that occur between xmin and xmax
     from cxotime import CxoTime
+    from Ska.Matplotlib import cxctime2plotdate
     for plot in plots.values():
         for eachpassage in perigee_passages:
             # The index [1] item is always the Perigee Passage time. Draw that
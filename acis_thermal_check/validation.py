@@ -0,0 +1,206 @@
+import numpy as np
+
+# The quantiles of the validation residuals which are
+# computed and written to the quantile table
+validation_quantiles = (1, 5, 16, 50, 84, 95, 99)
+
+
+def calc_quantiles(x, quantiles=validation_quantiles):
+    """
+    Compute quantiles of an array as the order statistics at
+    ``(len(x) * quant) // 100``, which are found by partitioning
+    the array rather than sorting all of it.
+
+    Parameters
+    ----------
+    x : NumPy array
+        The values.
+    quantiles : sequence of integers, optional
+        The quantiles to compute, in percent. Default:
+        ``validation_quantiles``
+
+    Returns
+    -------
+    A dictionary of the value of each quantile, keyed by the quantile.
+    """
+    n = len(x)
+    idxs = {quant: (n * quant) // 100 for quant in quantiles}
+    part = np.partition(x, sorted(set(idxs.values())))
+    return {quant: part[idx] for quant, idx in idxs.items()}
+
+
+class ResidualStats(object):
+    """
+    The statistics of the data - model residuals of an MSID used for
+    the validation of a model: the quantiles of the residuals and the
+    histograms of the residuals, which are computed once and can be
+    used for any number of plots.
+
+    Parameters
+    ----------
+    msid : string
+        The MSID.
+    diff : NumPy array
+        The residuals of the MSID, from which the quantiles and the
+        main histogram are computed.
+    diff2 : NumPy array, optional
+        The residuals for a second histogram, e.g. for a second
+        histogram limit. Default: None
+    fmt : string, optional
+        The format of the quantiles in the quantile table. Default:
+        "%.2f"
+    quantiles : sequence of integers, optional
+        The quantiles to compute, in percent. Default:
+        ``validation_quantiles``
+    bins : integer, optional
+        The number of bins of the histograms. Default: 50
+    """
+    def __init__(self, msid, diff, diff2=None, fmt="%.2f",
+                 quantiles=validation_quantiles, bins=50):
+        self.msid = msid
+        self.fmt = fmt
+        self.quantiles = calc_quantiles(diff, quantiles=quantiles)
+        self.hist = np.histogram(diff, bins=bins)
+        if diff2 is not None:
+            self.hist2 = np.histogram(diff2, bins=bins)
+        else:
+            self.hist2 = None
+
+    def as_dict(self):
+        """
+        The MSID and the formatted quantiles, as used by the report
+        and ``make_validation_viols``, e.g. {"msid": "1DPAMZT",
+        "quant01": "-1.23", ...}.
+        """
+        stats = dict(msid=self.msid.upper())
+        for quant, value in self.quantiles.items():
+            stats['quant%02d' % quant] = self.fmt % value
+        return stats
+
+    def plot_hist(self, ax, scale=1.0, log=False, color=None, color2=None):
+        """
+        Plot the histograms of the residuals as steps.
+
+        Parameters
+        ----------
+        ax : Matplotlib Axes
+            The axes to plot on.
+        scale : float, optional
+            The residuals are divided by this in the plot. Default: 1.0
+        log : boolean, optional
+            Whether to use a log scale for the counts. Default: False
+        color : string, optional
+            The color of the main histogram.
+        color2 : string, optional
+            The color of the second histogram, if there is one.
+        """
+        for hist, c in [(self.hist, color), (self.hist2, color2)]:
+            if hist is None:
+                continue
+            counts, edges = hist
+            edges = edges / scale
+            # Plot the counts which have already been computed
+            ax.hist(edges[:-1], bins=edges, weights=counts, log=log,
+                    histtype='step', color=c, linewidth=2)
+
+
+# The version of the format of the validation data files written
+# by write_validation_data
+validation_data_version = 1
+
+
+def write_validation_data(filename, pred, tlm):
+    """
+    Write the model values and the telemetry of a validation to an
+    uncompressed NPZ file, with one array for each column, so that
+    the columns can be memory-mapped and read one by one.
+
+    Parameters
+    ----------
+    filename : string
+        The path to the file.
+    pred : dict of NumPy arrays
+        The model values, keyed by MSID.
+    tlm : NumPy structured array
+        The telemetry interpolated to the model times.
+    """
+    arrays = {"version": np.array(validation_data_version),
+              "pred_keys": np.array(list(pred.keys())),
+              "tlm_names": np.array(list(tlm.dtype.names))}
+    for key, values in pred.items():
+        arrays["pred.%s" % key] = np.asarray(values)
+    for name in tlm.dtype.names:
+        arrays["tlm.%s" % name] = np.ascontiguousarray(tlm[name])
+    np.savez(filename, **arrays)
+
+
+def _mmap_npz_member(filename, info):
+    # Memory-map an array which is stored uncompressed in an NPZ
+    # file, or return None if it cannot be memory-mapped
+    import struct
+    import zipfile
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(filename, "rb") as f:
+        # Skip the local header of the file in the archive,
+        # whose name and extra field have variable lengths
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = struct.unpack("<HH", f.read(4))
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype.hasobject or np.prod(shape) == 0:
+        return None
+    return np.memmap(filename, dtype=dtype, mode="r", shape=shape,
+                     order="F" if fortran else "C", offset=offset)
+
+
+def read_validation_data(filename, mmap=True):
+    """
+    Read the model values and the telemetry of a validation, from
+    either an NPZ file written by :func:`write_validation_data` or a
+    pickle file written by older versions of acis_thermal_check.
+
+    Parameters
+    ----------
+    filename : string
+        The path to the file.
+    mmap : boolean, optional
+        Whether to memory-map the columns of an NPZ file, so that
+        each one is only read when it is used. Default: True
+
+    Returns
+    -------
+    A dictionary with the version of the format ("version", which is
+    0 for a pickle file), and the model values ("pred") and telemetry
+    ("tlm") as dictionaries of NumPy arrays, keyed by MSID.
+    """
+    import zipfile
+    if not zipfile.is_zipfile(filename):
+        import pickle
+        with open(filename, "rb") as f:
+            data = pickle.load(f)
+        tlm = data["tlm"]
+        return {"version": 0,
+                "pred": dict(data["pred"]),
+                "tlm": {name: tlm[name] for name in tlm.dtype.names}}
+    with np.load(filename) as npz, zipfile.ZipFile(filename) as zf:
+        version = int(npz["version"])
+        if version > validation_data_version:
+            raise RuntimeError("Version %d of the validation data in %s is "
+                               "newer than this version of acis_thermal_check "
+                               "can read!" % (version, filename))
+
+        def _column(key):
+            arr = None
+            if mmap:
+                arr = _mmap_npz_member(filename, zf.getinfo(key + ".npy"))
+            return npz[key] if arr is None else arr
+
+        pred = {str(key): _column("pred.%s" % key) for key in npz["pred_keys"]}
+        tlm = {str(name): _column("tlm.%s" % name) for name in npz["tlm_names"]}
+    return {"version": version, "pred": pred, "tlm": tlm}
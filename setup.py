@@ -15,4 +15,6 @@ setup(name='acis_thermal_check',
       url='http://github.com/acisops/acis_thermal_check',
       data_files=[('templates', templates), ('data', data)],
       include_package_data=True,
+      entry_points={'console_scripts': [
+          'acis_thermal_check_driver=acis_thermal_check.driver:main']},
       )